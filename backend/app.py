@@ -2,19 +2,37 @@
 from fastapi import FastAPI, HTTPException, Request, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
+import asyncio
 import json
+import mimetypes
+import os
+import tempfile
+import threading
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from gemini_client import call_gemini, transcribe_audio_with_gemini
-from media_utils import ENABLE_ASR, ENABLE_OCR, extract_ocr_bytes
+from gemini_client import (
+    call_gemini,
+    get_hedge_metrics,
+    get_output_metrics,
+    get_upstream_metrics,
+    record_parse,
+    structured_output_for,
+    transcribe_audio_with_gemini,
+)
+from media_utils import ENABLE_ASR, ENABLE_OCR, extract_ocr_bytes, extract_ocr_from_bytes
+import video_utils
 import storage
-from fastapi.staticfiles import StaticFiles
+from social_text import normalize_social_text
+from semantic_cache import get_semantic_cache
+from text_windows import merge_window_results, split_windows
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
 logger = logging.getLogger("uvicorn.error")
 
@@ -35,13 +53,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# If using local uploads, serve them at /uploads for demo convenience
-try:
-    if not storage.ENABLE_S3:
-        app.mount("/uploads", StaticFiles(directory=storage.UPLOAD_DIR), name="uploads")
-except Exception:
-    # best-effort; continue if static mounting not possible in some environments
-    pass
+# Local uploads are content-addressed, so they can be cached forever
+UPLOAD_CACHE_CONTROL = "public, max-age=31536000, immutable"
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _parse_byte_range(header: Optional[str], size: int):
+    """Parse a single-range `Range` header.
+
+    Returns (start, end) inclusive, None when the header is absent or not a
+    single byte range (serve the whole file), or False when unsatisfiable.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start_s, _, end_s = header[len("bytes="):].strip().partition("-")
+    try:
+        if not start_s:
+            # Suffix range: last N bytes
+            length = int(end_s)
+            if length <= 0:
+                return False
+            return max(0, size - length), size - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(path, start: int, end: int):
+    # Sync generator: Starlette iterates it in a threadpool, off the event loop
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    """Weak comparison of an `If-None-Match` header (list, `W/` prefixes, `*`) against `etag`."""
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+@app.on_event("startup")
+def _init_storage():
+    storage.init_storage()
+
+
+@app.api_route("/uploads/{key}", methods=["GET", "HEAD"])
+async def serve_upload(key: str, request: Request):
+    """Serve locally stored uploads with byte-range and caching support."""
+    backend = storage.get_storage()
+    if not isinstance(backend, storage.LocalStorage):
+        raise HTTPException(status_code=404, detail="Uploads are served from object storage")
+    path = backend.path_for(key)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not found")
+
+    size = path.stat().st_size
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": UPLOAD_CACHE_CONTROL, "Accept-Ranges": "bytes"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(key)[0] or "application/octet-stream"
+    byte_range = _parse_byte_range(request.headers.get("range"), size)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    if byte_range is False:
+        headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    if request.method == "HEAD":
+        return Response(status_code=206, media_type=media_type, headers=headers)
+    return StreamingResponse(_iter_file_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
 
 
 class TextAnalyzeRequest(BaseModel):
@@ -61,6 +165,15 @@ class TextAnalyzeResponse(BaseModel):
     mode_explanation: Optional[str] = None
 
 
+class LongTextAnalyzeResponse(TextAnalyzeResponse):
+    # Per-window offsets and scores
+    windows: List[dict]
+
+
+# Long-text results carry `windows`; listed first so they validate as such
+TextOrLongTextResponse = Union[LongTextAnalyzeResponse, TextAnalyzeResponse]
+
+
 class VoiceAnalyzeResponse(TextAnalyzeResponse):
     transcript: str
     timestamps_explanations: Optional[List[dict]] = []
@@ -72,12 +185,44 @@ class ImageAnalyzeResponse(TextAnalyzeResponse):
     attention_regions: Optional[List[dict]] = []
 
 
+class VideoAnalyzeResponse(TextAnalyzeResponse):
+    transcript: str
+    duration: float
+    transcript_segments: List[dict] = []
+    frames: List[dict] = []
+    timestamps_explanations: Optional[List[dict]] = []
+
+
 # Simple in-memory rate limiting per process (not for production)
 REQUESTS = 0
 START_TIME = time.time()
 RATE_LIMIT_PER_MIN = 120  # requests per minute per process
 
 
+# Long-text mode: inputs above the threshold are scored in parallel windows
+LONG_TEXT_THRESHOLD_CHARS = int(os.getenv("LONG_TEXT_THRESHOLD_CHARS", "4000"))
+LONG_TEXT_WINDOW_CHARS = int(os.getenv("LONG_TEXT_WINDOW_CHARS", "2000"))
+LONG_TEXT_OVERLAP_SENTENCES = int(os.getenv("LONG_TEXT_OVERLAP_SENTENCES", "1"))
+LONG_TEXT_MAX_WINDOWS = int(os.getenv("LONG_TEXT_MAX_WINDOWS", "16"))
+# Score every window at once by default, so latency stays close to one call
+LONG_TEXT_CONCURRENCY = int(os.getenv("LONG_TEXT_CONCURRENCY", str(LONG_TEXT_MAX_WINDOWS)))
+
+# Dedicated pool: the loop's default executor has only cpu_count + 4 threads
+_LONG_TEXT_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_LONG_TEXT_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_long_text_executor() -> ThreadPoolExecutor:
+    global _LONG_TEXT_EXECUTOR
+    if _LONG_TEXT_EXECUTOR is None:
+        with _LONG_TEXT_EXECUTOR_LOCK:
+            if _LONG_TEXT_EXECUTOR is None:
+                _LONG_TEXT_EXECUTOR = ThreadPoolExecutor(
+                    max_workers=max(1, LONG_TEXT_CONCURRENCY), thread_name_prefix="long-text"
+                )
+    return _LONG_TEXT_EXECUTOR
+
+
 def check_rate_limit():
     global REQUESTS, START_TIME
     now = time.time()
@@ -192,7 +337,62 @@ def parse_json_from_text(raw: str):
         return None
 
 
-@app.post("/api/analyze/text", response_model=TextAnalyzeResponse)
+def _compare_analyses(cached: str, fresh: Optional[dict]):
+    """Compare a cached and a fresh analysis: (labels agree, |intensity delta|)."""
+    if not fresh:
+        return None
+    cached = _normalize_analysis_payload(parse_json_from_text(cached))
+    fresh = _normalize_analysis_payload(fresh)
+    delta = abs(cached["sarcasm_intensity"] - fresh["sarcasm_intensity"])
+    return cached["sarcasm_label"] == fresh["sarcasm_label"], float(delta)
+
+
+def _parse_analysis(raw: str, schema: str):
+    """Parse a fresh model response into a dict, or None, and record the outcome.
+
+    Schema-constrained (structured-output) responses are valid JSON, so they
+    take a plain json.loads fast path; recovery parsing is only a fallback.
+    """
+    structured = structured_output_for(schema)
+    parsed = None
+    if structured:
+        try:
+            parsed = json.loads(raw)
+        except (TypeError, ValueError):
+            logger.warning("Structured Gemini output did not parse; falling back to recovery parsing")
+    if not isinstance(parsed, dict):
+        parsed = parse_json_from_text(raw)
+    record_parse(structured, bool(parsed))
+    if not parsed:
+        logger.error("Failed to parse JSON. Raw response: %s", (raw or "")[:1000])
+    return parsed
+
+
+def _cached_analysis(namespace: str, cache_text: str, prompt_text: str, schema: str) -> Optional[dict]:
+    """Parsed Gemini analysis behind the semantic near-duplicate cache (when enabled).
+
+    `cache_text` is the user content that identifies the request; the prompt
+    template is shared per namespace so it is not embedded. Returns None when
+    the response does not parse.
+    """
+    cache = get_semantic_cache()
+    if cache is None:
+        return _parse_analysis(call_gemini(prompt_text, schema=schema), schema)
+    hit = cache.lookup(namespace, cache_text)
+    if hit is not None:
+        logger.debug("Semantic cache hit (%s, similarity=%.3f)", namespace, hit.similarity)
+        cache.maybe_verify(
+            hit, lambda: _parse_analysis(call_gemini(prompt_text, schema=schema), schema), _compare_analyses
+        )
+        # Cached payloads were parsed when stored; they are not upstream parse attempts
+        return parse_json_from_text(hit.payload)
+    parsed = _parse_analysis(call_gemini(prompt_text, schema=schema), schema)
+    if parsed:
+        cache.insert(namespace, cache_text, json.dumps(parsed))
+    return parsed
+
+
+@app.post("/api/analyze/text", response_model=TextOrLongTextResponse)
 async def analyze_text(req: TextAnalyzeRequest, request: Request):
     if not req.text or len(req.text.strip()) == 0:
         raise HTTPException(status_code=400, detail="Text is required")
@@ -202,27 +402,25 @@ async def analyze_text(req: TextAnalyzeRequest, request: Request):
 
     # Build default mode prompt
     context_snippet = "\n".join(req.context[-3:]) if req.context else ""
-    prompt_text = (
-        f"Analyze the following text for sarcasm and tone. "
-        f"Focus on general language analysis without domain-specific elements. "
-        f"Text: \"{req.text}\"\nContext: \"{context_snippet}\"\nReturn JSON."
-    )
+    if len(req.text) > LONG_TEXT_THRESHOLD_CHARS:
+        return await _analyze_long_text(req.text, context_snippet)
+    prompt_text = _text_prompt(req.text, context_snippet)
+
+    cache_key = f"{req.text}\n{context_snippet}"
 
     # Retry wrapper: attempt call and one retry on failure
     try:
-        raw = call_gemini(prompt_text)
+        parsed = _cached_analysis("text", cache_key, prompt_text, "text")
     except Exception as e:
         logger.error("First Gemini call failed: %s", e)
         try:
             time.sleep(1)
-            raw = call_gemini(prompt_text)
+            parsed = _cached_analysis("text", cache_key, prompt_text, "text")
         except Exception as e2:
             logger.exception("Gemini call failed after retry: %s", e2)
             raise HTTPException(status_code=502, detail="Upstream analysis service error")
 
-    parsed = parse_json_from_text(raw)
     if not parsed:
-        logger.error("Failed to parse JSON. Raw response: %s", raw[:1000])
         raise HTTPException(status_code=502, detail="Failed to parse JSON from Gemini response")
 
     # Minimal validation and fallback defaults
@@ -231,12 +429,75 @@ async def analyze_text(req: TextAnalyzeRequest, request: Request):
     return resp
 
 
+def _text_prompt(text: str, context_snippet: str) -> str:
+    return (
+        f"Analyze the following text for sarcasm and tone. "
+        f"Focus on general language analysis without domain-specific elements. "
+        f"Text: \"{text}\"\nContext: \"{context_snippet}\"\nReturn JSON."
+    )
+
+
+def _score_window(text: str, context_snippet: str) -> Optional[dict]:
+    """Blocking: score one window with a single retry. Returns None on failure."""
+    prompt_text = _text_prompt(text, context_snippet)
+    for attempt in range(2):
+        try:
+            parsed = _cached_analysis("text", f"{text}\n{context_snippet}", prompt_text, "text")
+        except Exception as e:
+            logger.warning("Window analysis attempt %d failed: %s", attempt + 1, e)
+            parsed = None
+        if parsed:
+            return _normalize_analysis_payload(parsed)
+        if attempt == 0:
+            time.sleep(1)
+    return None
+
+
+async def _analyze_long_text(text: str, context_snippet: str) -> dict:
+    """Score sentence-aligned windows concurrently and pool them into one payload."""
+    windows = split_windows(
+        text, LONG_TEXT_WINDOW_CHARS, LONG_TEXT_OVERLAP_SENTENCES, max_windows=LONG_TEXT_MAX_WINDOWS
+    )
+    loop = asyncio.get_running_loop()
+    executor = _get_long_text_executor()
+
+    async def score(window):
+        return await loop.run_in_executor(executor, _score_window, window.text, context_snippet)
+
+    payloads = await asyncio.gather(*(score(w) for w in windows))
+    scored = [(w, p) for w, p in zip(windows, payloads) if p is not None]
+    if not scored:
+        raise HTTPException(status_code=502, detail="Upstream analysis service error")
+    if len(scored) < len(windows):
+        logger.warning("Long-text analysis: %d of %d windows failed", len(windows) - len(scored), len(windows))
+    return merge_window_results([w for w, _ in scored], [p for _, p in scored])
+
+
 @app.get("/health")
 @app.get("/api/health")
 async def health():
     return {"status": "ok"}
 
 
+@app.get("/api/metrics")
+async def metrics():
+    """Expose in-process upstream metrics (per worker, reset on restart)."""
+    cache = get_semantic_cache()
+    return {
+        "hedging": get_hedge_metrics(),
+        **get_upstream_metrics(),
+        "output": get_output_metrics(),
+        "semantic_cache": cache.snapshot() if cache else {"enabled": False},
+    }
+
+
+@app.on_event("shutdown")
+def _persist_semantic_cache():
+    cache = get_semantic_cache()
+    if cache is not None:
+        cache.save()
+
+
 @app.post("/api/analyze/voice", response_model=VoiceAnalyzeResponse)
 async def analyze_voice(
     audio_file: Optional[UploadFile] = File(None), 
@@ -287,8 +548,8 @@ async def analyze_voice(
             )
 
     prompt_text = f'Transcript: "{transcript}"\nAcoustic notes: "{acoustic_notes or ""}"\nReturn JSON.'
-    raw = call_gemini(prompt_text)
-    parsed = parse_json_from_text(raw)
+    raw = call_gemini(prompt_text, schema="voice")
+    parsed = _parse_analysis(raw, "voice")
     if not parsed:
         raise HTTPException(status_code=502, detail="Failed to parse JSON from Gemini response")
     def try_parse_json_field(val):
@@ -357,18 +618,19 @@ async def analyze_image(
     domain = request.headers.get("X-Domain", "default")
 
     if domain == "social_media":
+        cache_text = preprocess_social_media(ocr_text)
         prompt_text = (
             "Analyze the following OCR text as social media content (memes, screenshots, DMs). "
             "Account for sarcasm cues like hashtags, emojis, and exaggerated slang."
-            f"\nOCR text: \"{ocr_text}\""
+            f"\nOCR text: \"{cache_text}\""
             f"\nImage caption/context: \"{image_caption or ''}\""
             "\nReturn JSON with sarcasm_label, sarcasm_intensity, emotions, risk_score, highlights, explanation."
         )
     else:
+        cache_text = ocr_text
         prompt_text = f'OCR text: "{ocr_text}"\nImage caption: "{image_caption or ""}"\nReturn JSON.'
 
-    raw = call_gemini(prompt_text)
-    parsed = parse_json_from_text(raw)
+    parsed = _cached_analysis(f"image:{domain}", f"{cache_text}\n{image_caption or ''}", prompt_text, "image")
     if not parsed:
         raise HTTPException(status_code=502, detail="Failed to parse JSON from Gemini response")
 
@@ -403,7 +665,88 @@ async def analyze_image(
     return resp
 
 
-@app.post("/api/analyze", response_model=TextAnalyzeResponse)
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+async def _spool_upload(upload: UploadFile, path: str, max_bytes: int) -> int:
+    """Stream an upload to disk in chunks without holding it in memory."""
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = await upload.read(1024 * 1024)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Video exceeds {max_bytes // (1024 * 1024)} MB limit")
+            await asyncio.to_thread(f.write, chunk)
+    return size
+
+
+@app.post("/api/analyze/video", response_model=VideoAnalyzeResponse)
+async def analyze_video(
+    video_file: UploadFile = File(...),
+    context: Optional[str] = Form(None),
+):
+    """Analyze a video by fusing its speech transcript with on-screen text.
+
+    The audio track is transcribed in segments and scene-change keyframes are
+    OCR'd concurrently; the timestamped results go to Gemini in one prompt.
+    """
+    if not video_utils.ffmpeg_available():
+        raise HTTPException(status_code=500, detail="Video analysis requires ffmpeg on the server.")
+
+    with tempfile.TemporaryDirectory(prefix="video_") as workdir:
+        suffix = os.path.splitext(video_file.filename or "")[1][:10] or ".mp4"
+        video_path = os.path.join(workdir, "input" + suffix)
+        await _spool_upload(video_file, video_path, VIDEO_MAX_BYTES)
+        logger.info(f"Received video file: {video_file.filename}, content_type: {video_file.content_type}")
+
+        try:
+            signals = await asyncio.to_thread(
+                video_utils.extract_video_signals,
+                video_path,
+                workdir,
+                lambda data, mime: transcribe_audio_with_gemini(data, mime, timeout=60),
+                extract_ocr_from_bytes if ENABLE_OCR else None,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    segments = signals["transcript_segments"]
+    frames = signals["frames"]
+    if not segments and not frames:
+        raise HTTPException(status_code=422, detail="No speech or on-screen text found in the video.")
+
+    transcript_lines = "\n".join(f"[{s['t']:.1f}s] {s['text']}" for s in segments) or "(no speech)"
+    frame_lines = "\n".join(f"[{f['t']:.1f}s] {f['ocr_text']}" for f in frames) or "(no on-screen text)"
+    prompt_text = (
+        "Analyze this video for sarcasm using its speech transcript and on-screen text, "
+        "both timestamped in seconds. Look for contrast between what is said and what is shown."
+        f"\nTranscript:\n{transcript_lines}"
+        f"\nOn-screen text (keyframes):\n{frame_lines}"
+        f"\nContext: \"{context or ''}\""
+        "\nReturn JSON. Also include \"timestamps_explanations\": a list of "
+        "{\"t\": seconds, \"source\": \"speech\" or \"screen\", \"explanation\": text} for moments with sarcasm cues."
+    )
+
+    raw = await asyncio.to_thread(call_gemini, prompt_text, schema="video")
+    parsed = _parse_analysis(raw, "video")
+    if not parsed:
+        raise HTTPException(status_code=502, detail="Failed to parse JSON from Gemini response")
+
+    payload = _normalize_analysis_payload(parsed)
+    return {
+        **payload,
+        "transcript": " ".join(s["text"] for s in segments),
+        "duration": signals["duration"],
+        "transcript_segments": segments,
+        "frames": frames,
+        "timestamps_explanations": try_parse_json_field(parsed.get("timestamps_explanations", [])) or [],
+    }
+
+
+@app.post("/api/analyze", response_model=TextOrLongTextResponse)
 async def analyze(req: TextAnalyzeRequest, request: Request):
     domain = request.headers.get("X-Domain", "default")  # Read domain from headers
 
@@ -432,27 +775,20 @@ async def analyze_social_media(req: TextAnalyzeRequest):
     # Build enhanced social media-specific prompt with more examples
     prompt_text = (
         f"Analyze the following text in the context of social media. "
-        f"Consider hashtags, emojis, informal expressions, and the tone typical of social media posts. "
+        f"The text is normalized: hashtags are segmented into lowercase words (#living-the-dream), "
+        f"emojis are replaced by sentiment tags in angle brackets (<annoyed x2> means two such emojis), "
+        f"links are <url>, mentions are @user and slang is expanded. "
+        f"Consider these cues, informal expressions, and the tone typical of social media posts. "
         f"Provide an explanation that references these elements explicitly. "
         f"Examples:\n"
-        f"1. \"Wow, another Monday morning. Just what I needed to start my week off perfectly. #Blessed #LivingTheDream\"\n"
-        f"   Sarcasm: High intensity, Explanation: Overly positive language and hashtags used ironically to express annoyance.\n"
-        f"2. \"Best coffee ever! #Amazing #Blessed\"\n"
-        f"   Sarcasm: None, Explanation: Genuine positive sentiment expressed through hashtags and adjectives.\n"
-        f"3. \"Sure, because staying late at work is my favorite thing to do. #WorkLife #Goals\"\n"
-        f"   Sarcasm: High intensity, Explanation: Irony in expressing enjoyment of staying late at work.\n"
-        f"4. \"Had a great time at the party last night! 🎉 #FunTimes\"\n"
-        f"   Sarcasm: None, Explanation: Genuine excitement and positive sentiment conveyed through emojis and hashtags.\n"
-        f"5. \"Oh, fantastic! Another software update that breaks everything. #TechLife\"\n"
-        f"   Sarcasm: High intensity, Explanation: Sarcasm in expressing frustration with software updates.\n"
+        f"{_social_prompt_examples()}"
         f"Text: \"{processed_text}\"\n"
         f"Context: \"{context_snippet}\"\n"
         "Return JSON with keys: sarcasm_label, sarcasm_intensity, emotions, risk_score, highlights, explanation."
     )
 
     # Use the default text analysis pipeline on processed text
-    raw = call_gemini(prompt_text)
-    parsed = parse_json_from_text(raw)
+    parsed = _cached_analysis("social", f"{processed_text}\n{context_snippet}", prompt_text, "text")
     if not parsed:
         raise HTTPException(status_code=502, detail="Failed to parse JSON from Gemini response")
     payload = _normalize_analysis_payload(parsed)
@@ -476,14 +812,47 @@ async def analyze_social_media(req: TextAnalyzeRequest):
     return payload
 
 
+# Few-shot examples for the social pipeline: (raw post, expected verdict)
+SOCIAL_PROMPT_EXAMPLES = [
+    (
+        "Wow, another Monday morning. Just what I needed to start my week off perfectly. #Blessed #LivingTheDream",
+        "Sarcasm: High intensity, Explanation: Overly positive language and hashtags used ironically to express annoyance.",
+    ),
+    (
+        "Best coffee ever! #Amazing #Blessed",
+        "Sarcasm: None, Explanation: Genuine positive sentiment expressed through hashtags and adjectives.",
+    ),
+    (
+        "Sure, because staying late at work is my favorite thing to do. #WorkLife #Goals",
+        "Sarcasm: High intensity, Explanation: Irony in expressing enjoyment of staying late at work.",
+    ),
+    (
+        "Had a great time at the party last night! 🎉 #FunTimes",
+        "Sarcasm: None, Explanation: Genuine excitement and positive sentiment conveyed through emojis and hashtags.",
+    ),
+    (
+        "Oh, fantastic! Another software update that breaks everything. #TechLife",
+        "Sarcasm: High intensity, Explanation: Sarcasm in expressing frustration with software updates.",
+    ),
+]
+_SOCIAL_EXAMPLES_BLOCK: Optional[str] = None
+
+
+def _social_prompt_examples() -> str:
+    """Few-shot examples normalized like the input, so they match its format."""
+    global _SOCIAL_EXAMPLES_BLOCK
+    if _SOCIAL_EXAMPLES_BLOCK is None:
+        _SOCIAL_EXAMPLES_BLOCK = "".join(
+            f"{i}. \"{preprocess_social_media(post)}\"\n   {verdict}\n"
+            for i, (post, verdict) in enumerate(SOCIAL_PROMPT_EXAMPLES, start=1)
+        )
+    return _SOCIAL_EXAMPLES_BLOCK
+
+
 def preprocess_social_media(text: str):
     """Preprocess text for social media analysis.
 
-    Example: Remove hashtags, analyze emojis, expand slang, etc.
+    Segments hashtags, maps emojis to sentiment tags, expands slang, squashes
+    elongations and collapses URLs/mentions (see `social_text`).
     """
-    # Basic example: remove hashtags and mentions
-    text = text.replace('#', '').replace('@', '')
-
-    # TODO: Add more preprocessing as needed (e.g., emoji analysis, slang expansion)
-
-    return text
+    return normalize_social_text(text)
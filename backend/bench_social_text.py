@@ -0,0 +1,106 @@
+﻿"""Benchmark for the social-media text normalizer.
+
+Reports normalization throughput (seconds per million posts) for single-post
+and batch calls, plus the estimated reduction in prompt tokens. Batch calls
+skip exact duplicates, so batch throughput is reported twice: on an all-unique
+corpus (the cost of normalizing) and on the repeated corpus (with its dedup
+ratio, the retweet/copypasta case).
+
+Usage: python bench_social_text.py [--posts 200000] [--unique 5000]
+"""
+import argparse
+import math
+import random
+import re
+import time
+
+from social_text import SocialTextNormalizer
+
+_TEMPLATES = [
+    "Wow, another {day} morning. Just what I needed {emo}{emo}{emo} #Blessed #LivingTheDream",
+    "@{user} @{user} soooooo {adj} lol ngl {url} #{tag}",
+    "tbh idk why ppl r like this fr fr {emo} {url}",
+    "Sure, because staying late at work is my favorite thing to do!!!!! #WorkLife #Goals {emo}",
+    "Oh fantastic, another software update that breaks everything {emo}{emo} #TechLife @{user}",
+    "Had a greeeeat time at the party last night {emo} #funtimes #bestdayever",
+    "omg this is sooo {adj} rn smh {emo} {url} {url}",
+    "Best coffee ever! #Amazing #Blessed {emo}",
+]
+_EMOJI = ["😂", "🙄", "🙃", "😒", "💀", "🔥", "👏", "😭", "🎉", "✨", "👍🏽"]
+_ADJ = ["great", "amazing", "fun", "perfect", "awesome", "thrilling"]
+_DAYS = ["Monday", "Tuesday", "Friday"]
+_TAGS = ["mondaymotivation", "firstworldproblems", "adultinglife", "TBT", "sarcasm"]
+
+_APPROX_TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def approx_tokens(text: str) -> int:
+    """Rough BPE-style token estimate: ~4 chars per word piece, 2 per emoji/non-ASCII symbol."""
+    total = 0
+    for piece in _APPROX_TOKEN_RE.findall(text):
+        if piece.isascii():
+            total += max(1, math.ceil(len(piece) / 4)) if piece[0].isalnum() else 1
+        else:
+            total += 2
+    return total
+
+
+def make_posts(n_unique: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    posts = []
+    for i in range(n_unique):
+        tpl = rng.choice(_TEMPLATES)
+        posts.append(tpl.format(
+            day=rng.choice(_DAYS),
+            emo=rng.choice(_EMOJI),
+            user=f"user{rng.randint(1, 999)}",
+            adj=rng.choice(_ADJ),
+            url=f"https://t.co/{rng.getrandbits(40):x}",
+            tag=rng.choice(_TAGS),
+        ))
+    return posts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=200_000, help="posts to normalize per run")
+    parser.add_argument("--unique", type=int, default=5_000, help="posts generated before repeating (templates may collide)")
+    args = parser.parse_args()
+
+    unique = make_posts(args.unique)
+    corpus = [unique[i % len(unique)] for i in range(args.posts)]
+    normalizer = SocialTextNormalizer()
+    normalizer.normalize_batch(unique[:100])  # warm hashtag cache
+
+    start = time.perf_counter()
+    single = [normalizer.normalize(p) for p in corpus]
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch = normalizer.normalize_batch(corpus)
+    batch_s = time.perf_counter() - start
+    assert single == batch
+
+    # Same size, every post distinct (a trailing index defeats the dedup)
+    distinct = [f"{p} {i}" for i, p in enumerate(corpus)]
+    start = time.perf_counter()
+    normalizer.normalize_batch(distinct)
+    distinct_s = time.perf_counter() - start
+    n_distinct = len(set(corpus))
+
+    raw_tokens = sum(approx_tokens(p) for p in unique)
+    norm_tokens = sum(approx_tokens(p) for p in normalizer.normalize_batch(unique))
+    scale = 1_000_000 / args.posts
+
+    print(f"posts: {args.posts:,} ({n_distinct:,} distinct)")
+    print(f"single-post:       {single_s * scale:8.2f} s per 1M posts ({args.posts / single_s:,.0f} posts/s)")
+    print(f"batch, all unique: {distinct_s * scale:8.2f} s per 1M posts ({args.posts / distinct_s:,.0f} posts/s)")
+    print(f"batch, repeated:   {batch_s * scale:8.2f} s per 1M posts ({args.posts / batch_s:,.0f} posts/s, "
+          f"{args.posts / n_distinct:.0f}x duplication)")
+    print(f"prompt tokens (approx): {raw_tokens / len(unique):.1f} -> {norm_tokens / len(unique):.1f} per post "
+          f"({100 * (1 - norm_tokens / raw_tokens):.1f}% reduction)")
+    print(f"example: {unique[0]!r}\n      -> {normalizer.normalize(unique[0])!r}")
+
+
+if __name__ == "__main__":
+    main()
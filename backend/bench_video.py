@@ -0,0 +1,75 @@
+﻿"""End-to-end latency benchmark for /api/analyze/video.
+
+Generates synthetic videos (moving test pattern with burned-in captions and a
+sine-tone audio track) of increasing length with ffmpeg, posts each to the
+endpoint through FastAPI's TestClient and reports latency against length.
+
+Without GEMINI_API_KEY the Gemini calls are mocked, so the numbers measure the
+demux / worker-pool pipeline; set the key (and OCR_SPACE_API_KEY) to include
+real upstream latency.
+
+Usage: python bench_video.py [--lengths 10 30 60 120] [--runs 2] [--no-ocr]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def make_video(path: str, seconds: int) -> None:
+    # Caption changes every 5 s so scene detection and OCR have work to do
+    captions = ",".join(
+        f"drawtext=text='Caption {i}':fontsize=48:fontcolor=white:x=40:y=40:"
+        f"enable='between(t,{i * 5},{i * 5 + 5})'"
+        for i in range(max(1, seconds // 5))
+    )
+    subprocess.run(
+        ["ffmpeg", "-y", "-loglevel", "error",
+         "-f", "lavfi", "-i", f"testsrc2=size=640x360:rate=25:duration={seconds}",
+         "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+         "-vf", captions, "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path],
+        check=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 30, 60, 120], help="video lengths in seconds")
+    parser.add_argument("--runs", type=int, default=2, help="requests per length")
+    parser.add_argument("--no-ocr", action="store_true", help="skip keyframe OCR (sets ENABLE_OCR=false)")
+    args = parser.parse_args()
+
+    if args.no_ocr:
+        os.environ["ENABLE_OCR"] = "false"
+    # Import after env tweaks: app modules read configuration at import time
+    from fastapi.testclient import TestClient
+    from app import app
+
+    client = TestClient(app)
+    print(f"{'length_s':>8} {'size_MB':>8} {'median_s':>9} {'min_s':>7} {'frames':>6} {'segments':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds in args.lengths:
+            path = os.path.join(tmp, f"bench_{seconds}s.mp4")
+            make_video(path, seconds)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            latencies = []
+            body = {}
+            for _ in range(args.runs):
+                with open(path, "rb") as f:
+                    start = time.perf_counter()
+                    resp = client.post("/api/analyze/video", files={"video_file": ("bench.mp4", f, "video/mp4")})
+                    latencies.append(time.perf_counter() - start)
+                if resp.status_code != 200:
+                    print(f"{seconds:>8} request failed: {resp.status_code} {resp.text[:200]}", file=sys.stderr)
+                    break
+                body = resp.json()
+            if latencies:
+                print(f"{seconds:>8} {size_mb:>8.2f} {statistics.median(latencies):>9.2f} {min(latencies):>7.2f} "
+                      f"{len(body.get('frames', [])):>6} {len(body.get('transcript_segments', [])):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,41 @@
 ﻿"""Gemini client with a safe mock fallback for local development.
 
-This helper will call a real Gemini-like API when `GEMINI_API_KEY` is set and
-`GEMINI_API_URL` is configured. When those are missing (or the URL contains
-the example placeholder), it returns a canned JSON string so the app can be
-tested/demoed without external credentials.
+This helper will call a real Gemini-like API when `GEMINI_API_KEY` (or the
+multi-key `GEMINI_API_KEYS`) is set; requests are spread over the configured
+keys and models by `upstream_pool`. When no key is configured, it returns a
+canned JSON string so the app can be tested/demoed without external
+credentials.
 """
 from __future__ import annotations
 
 import os
 import json
 import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from fastapi.exceptions import HTTPException
 
+from upstream_pool import UpstreamUnavailable, build_pool_from_env
+
 logger = logging.getLogger(__name__)
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
-# Google Generative AI API endpoint - using gemini-flash-latest (stable API with text output)
-GEMINI_API_URL = os.getenv(
-    "GEMINI_API_URL",
-    f"https://generativelanguage.googleapis.com/v1beta/models/gemini-flash-latest:generateContent?key={GEMINI_API_KEY}"
-)
+# Upstream pool of API keys x model endpoints (see upstream_pool). With only
+# GEMINI_API_KEY set this is a single upstream on gemini-flash-latest.
+_POOL = build_pool_from_env()
+
+# Tiered routing: start on the first (cheapest) model in GEMINI_MODELS and
+# escalate to the next tier when the output does not parse or the verdict is
+# ambiguous (sarcasm_intensity inside the escalation band). Without tiered
+# routing every request goes to the last (strongest) tier.
+TIERED_ROUTING = os.getenv("GEMINI_TIERED_ROUTING", "false").lower() == "true"
+ESCALATE_MIN_INTENSITY = int(os.getenv("GEMINI_ESCALATE_MIN_INTENSITY", "40"))
+ESCALATE_MAX_INTENSITY = int(os.getenv("GEMINI_ESCALATE_MAX_INTENSITY", "60"))
 
 # Enhanced system prompt for better sarcasm detection with strict JSON output
 SYSTEM_PROMPT = """Analyze the following text for sarcasm and tone. Return ONLY a valid JSON object, nothing else. No explanation, no markdown, no extra text.
@@ -37,6 +50,109 @@ The JSON must have exactly these keys:
   "explanation": "brief explanation in 1-2 sentences"
 }"""
 
+# Video analyses also need per-moment explanations, which SYSTEM_PROMPT's
+# "exactly these keys" would forbid
+VIDEO_SYSTEM_PROMPT = """Analyze the following video transcript and on-screen text for sarcasm and tone. Return ONLY a valid JSON object, nothing else. No explanation, no markdown, no extra text.
+
+The JSON must have exactly these keys:
+{
+  "sarcasm_label": "sarcastic" or "not_sarcastic",
+  "sarcasm_intensity": 0-100,
+  "emotions": [{"label": "emotion_name", "prob": 0.0-1.0}],
+  "risk_score": 0-100,
+  "highlights": ["phrase1", "phrase2"],
+  "explanation": "brief explanation in 1-2 sentences",
+  "timestamps_explanations": [{"t": seconds, "source": "speech" or "screen", "explanation": "why this moment is sarcastic"}]
+}"""
+
+# System prompt per endpoint in prose (non-structured) mode
+PROSE_SYSTEM_PROMPTS = {"video": VIDEO_SYSTEM_PROMPT}
+
+# Structured-output mode: send a per-endpoint response schema so the provider
+# returns schema-valid JSON, which lets callers skip the recovery parsing.
+STRUCTURED_OUTPUT = os.getenv("GEMINI_STRUCTURED_OUTPUT", "false").lower() == "true"
+# Thinking tokens count against maxOutputTokens. Unset (the default) sends no
+# thinkingConfig, since models without thinking or that cannot turn it off
+# reject it; set GEMINI_THINKING_BUDGET (e.g. 0) only for models that accept it.
+_THINKING_BUDGET_ENV = os.getenv("GEMINI_THINKING_BUDGET", "").strip()
+STRUCTURED_THINKING_BUDGET = int(_THINKING_BUDGET_ENV) if _THINKING_BUDGET_ENV else None
+
+# The schema carries the output format, so the prompt only states the task
+STRUCTURED_PROMPT = (
+    "Analyze the following for sarcasm and tone. sarcasm_intensity and risk_score are 0-100, "
+    "emotion probs are 0.0-1.0, highlights quote short phrases, explanation is 1-2 sentences."
+)
+
+_EMOTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {"label": {"type": "STRING"}, "prob": {"type": "NUMBER"}},
+    "required": ["label", "prob"],
+}
+_ANALYSIS_PROPERTIES = {
+    "sarcasm_label": {"type": "STRING", "enum": ["sarcastic", "not_sarcastic"]},
+    "sarcasm_intensity": {"type": "INTEGER"},
+    "emotions": {"type": "ARRAY", "items": _EMOTION_SCHEMA},
+    "risk_score": {"type": "INTEGER"},
+    "highlights": {"type": "ARRAY", "items": {"type": "STRING"}},
+    "explanation": {"type": "STRING"},
+}
+_ANALYSIS_REQUIRED = list(_ANALYSIS_PROPERTIES)
+
+
+def _analysis_schema(optional=(), **extra) -> dict:
+    """Analysis schema plus endpoint-specific `extra` properties (required unless in `optional`)."""
+    return {
+        "type": "OBJECT",
+        "properties": {**_ANALYSIS_PROPERTIES, **extra},
+        "required": _ANALYSIS_REQUIRED + [name for name in extra if name not in optional],
+        "propertyOrdering": list(_ANALYSIS_PROPERTIES) + list(extra),
+    }
+
+
+# Response schema and output token budget per endpoint
+RESPONSE_SCHEMAS = {
+    "text": _analysis_schema(),
+    # The voice transcript carries no timestamps, so there are no times to
+    # report: explanations quote the cue instead, and the list is optional
+    "voice": _analysis_schema(
+        optional=("timestamps_explanations",),
+        timestamps_explanations={
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"quote": {"type": "STRING"}, "explanation": {"type": "STRING"}},
+                "required": ["quote", "explanation"],
+            },
+        },
+    ),
+    "image": _analysis_schema(
+        offensive_flag={"type": "BOOLEAN"},
+        attention_regions={
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {"text": {"type": "STRING"}, "reason": {"type": "STRING"}},
+                "required": ["text", "reason"],
+            },
+        },
+    ),
+    "video": _analysis_schema(timestamps_explanations={
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "t": {"type": "NUMBER"},
+                "source": {"type": "STRING", "enum": ["speech", "screen"]},
+                "explanation": {"type": "STRING"},
+            },
+            "required": ["t", "source", "explanation"],
+        },
+    }),
+}
+MAX_OUTPUT_TOKENS = {"text": 384, "voice": 512, "image": 448, "video": 768}
+# Budget for free-form (prose JSON) requests
+PROSE_MAX_OUTPUT_TOKENS = 1000
+
 DEFAULT_HEADERS = {"Content-Type": "application/json"}
 
 
@@ -45,9 +161,12 @@ def _create_session(total_retries: int = 3, backoff_factor: float = 0.5) -> requ
     retries = Retry(
         total=total_retries,
         backoff_factor=backoff_factor,
-        status_forcelist=[429, 500, 502, 503, 504],
+        # 429s are not retried here: the upstream pool drains the key and moves on.
+        # Retry would otherwise still sleep on and retry any 429 carrying Retry-After.
+        status_forcelist=[500, 502, 503, 504],
         allowed_methods=["POST", "GET"],
         raise_on_status=False,
+        respect_retry_after_header=False,
     )
     adapter = HTTPAdapter(max_retries=retries)
     s.mount("https://", adapter)
@@ -59,6 +178,246 @@ def _create_session(total_retries: int = 3, backoff_factor: float = 0.5) -> requ
 _SESSION = _create_session()
 
 
+# Hedged requests: when an upstream call is slower than the rolling latency
+# quantile for its endpoint, fire a second identical request and take whichever
+# answers first. Disabled by default; the hedge budget bounds extra quota use.
+HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_QUANTILE = float(os.getenv("GEMINI_HEDGE_QUANTILE", "0.9"))
+HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+# Fraction of primary requests that may be hedged (token bucket refill rate)
+HEDGE_MAX_RATE = float(os.getenv("GEMINI_HEDGE_MAX_RATE", "0.1"))
+
+
+class _LatencyTracker:
+    """Rolling window of successful request latencies per endpoint key (call type and model)."""
+
+    def __init__(self, window: int = 200):
+        self._window = window
+        self._samples: dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if samples is None:
+                samples = self._samples[endpoint] = deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def endpoints(self) -> list[str]:
+        with self._lock:
+            return sorted(self._samples)
+
+    def quantile(self, endpoint: str, q: float, min_samples: int) -> float | None:
+        with self._lock:
+            samples = self._samples.get(endpoint)
+            if not samples or len(samples) < min_samples:
+                return None
+            ordered = sorted(samples)
+        idx = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[idx]
+
+
+class _HedgeBudget:
+    """Token bucket: each primary request earns `rate` tokens, each hedge spends one."""
+
+    def __init__(self, rate: float, burst: float = 10.0):
+        self._rate = rate
+        self._burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self._burst, self._tokens + self._rate)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+_LATENCY = _LatencyTracker()
+_HEDGE_BUDGET = _HedgeBudget(HEDGE_MAX_RATE)
+_HEDGE_METRICS = {
+    "requests": 0,
+    "hedges_fired": 0,
+    "hedges_won": 0,
+    "hedges_skipped_budget": 0,
+}
+_ROUTING_METRICS = {
+    "escalations": 0,
+    "escalated_unparseable": 0,
+    "escalated_low_confidence": 0,
+    "escalated_unavailable": 0,
+    "escalated_error": 0,
+}
+_OUTPUT_METRICS = {
+    mode: {"calls": 0, "output_tokens": 0, "truncated": 0, "parse_attempts": 0, "parse_failures": 0}
+    for mode in ("structured", "prose")
+}
+_METRICS_LOCK = threading.Lock()
+
+
+def _bump(metric: str, counters: dict = _HEDGE_METRICS) -> None:
+    with _METRICS_LOCK:
+        counters[metric] += 1
+
+
+def get_hedge_metrics() -> dict:
+    """Return a snapshot of hedging counters and current hedge thresholds."""
+    with _METRICS_LOCK:
+        snapshot = dict(_HEDGE_METRICS)
+    snapshot["enabled"] = HEDGE_ENABLED
+    snapshot["thresholds"] = {
+        endpoint: _LATENCY.quantile(endpoint, HEDGE_QUANTILE, HEDGE_MIN_SAMPLES)
+        for endpoint in _LATENCY.endpoints()
+    }
+    return snapshot
+
+
+def get_upstream_metrics() -> dict:
+    """Return per-upstream utilization/quota counters and tier escalation counts."""
+    with _METRICS_LOCK:
+        routing = dict(_ROUTING_METRICS)
+    routing["tiered"] = TIERED_ROUTING
+    return {"upstreams": _POOL.snapshot(), "routing": routing}
+
+
+def structured_output_for(schema: str | None) -> bool:
+    """True when calls for `schema` use the provider's schema-constrained output."""
+    return STRUCTURED_OUTPUT and schema in RESPONSE_SCHEMAS and _POOL.configured
+
+
+def record_parse(structured: bool, ok: bool) -> None:
+    """Record whether the caller could parse an analysis returned by `call_gemini`."""
+    counters = _OUTPUT_METRICS["structured" if structured else "prose"]
+    with _METRICS_LOCK:
+        counters["parse_attempts"] += 1
+        if not ok:
+            counters["parse_failures"] += 1
+
+
+def _record_usage(mode: str, data) -> None:
+    counters = _OUTPUT_METRICS[mode]
+    usage = data.get("usageMetadata", {}) if isinstance(data, dict) else {}
+    candidates = data.get("candidates") if isinstance(data, dict) else None
+    finish = candidates[0].get("finishReason") if candidates and isinstance(candidates[0], dict) else None
+    with _METRICS_LOCK:
+        counters["calls"] += 1
+        counters["output_tokens"] += int(usage.get("candidatesTokenCount") or 0)
+        if finish == "MAX_TOKENS":
+            counters["truncated"] += 1
+
+
+def get_output_metrics() -> dict:
+    """Parse-failure rate and output tokens, split by structured vs prose mode."""
+    with _METRICS_LOCK:
+        snapshot = {mode: dict(c) for mode, c in _OUTPUT_METRICS.items()}
+    for c in snapshot.values():
+        c["avg_output_tokens"] = round(c["output_tokens"] / c["calls"], 1) if c["calls"] else None
+        c["parse_failure_rate"] = round(c["parse_failures"] / c["parse_attempts"], 4) if c["parse_attempts"] else None
+    snapshot["structured_enabled"] = STRUCTURED_OUTPUT
+    return snapshot
+
+
+def _timed(endpoint: str, send):
+    """Run `send()` and record its latency when it produces a successful response."""
+    started = time.monotonic()
+    resp = send()
+    if resp.ok:
+        _LATENCY.record(endpoint, time.monotonic() - started)
+    return resp
+
+
+def _start_attempt(endpoint: str, send) -> tuple[Future, threading.Event]:
+    """Run `send()` on its own thread right away.
+
+    Attempts are never queued behind a bounded pool, so hedging does not cap
+    upstream concurrency. Returns the attempt's future and an event set when
+    `send()` actually begins.
+    """
+    future: Future = Future()
+    began = threading.Event()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        began.set()
+        try:
+            future.set_result(_timed(endpoint, send))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="gemini-hedge", daemon=True).start()
+    return future, began
+
+
+def _discard(future) -> None:
+    """Cancel a losing attempt; if it already started, close its response when it lands."""
+    if future.cancel():
+        return
+
+    def _close(f):
+        try:
+            f.result().close()
+        except Exception:
+            pass
+
+    future.add_done_callback(_close)
+
+
+def _hedged_post(endpoint: str, send) -> requests.Response:
+    """Issue `send()` and hedge it with a duplicate once it exceeds the endpoint's threshold.
+
+    `send` is a zero-argument callable performing one upstream POST. The first
+    attempt to return a response wins; a failing attempt only wins if the other
+    one fails too.
+    """
+    _bump("requests")
+    if not HEDGE_ENABLED:
+        return _timed(endpoint, send)
+
+    _HEDGE_BUDGET.deposit()
+    threshold = _LATENCY.quantile(endpoint, HEDGE_QUANTILE, HEDGE_MIN_SAMPLES)
+    if threshold is None:
+        # Not enough history to pick a sensible hedge delay yet
+        return _timed(endpoint, send)
+
+    primary, began = _start_attempt(endpoint, send)
+    # The hedge delay counts from when the primary request is actually sent
+    began.wait()
+    done, _ = wait([primary], timeout=max(threshold, HEDGE_MIN_DELAY))
+    if done:
+        return primary.result()
+
+    if not _HEDGE_BUDGET.withdraw():
+        _bump("hedges_skipped_budget")
+        return primary.result()
+
+    _bump("hedges_fired")
+    logger.debug("Hedging %s request after %.2fs", endpoint, threshold)
+    hedge, _ = _start_attempt(endpoint, send)
+    finished: set = set()
+    pending = {primary, hedge}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        finished |= done
+        winner = next((f for f in done if f.exception() is None and f.result().ok), None)
+        if winner is None and pending:
+            continue
+        if winner is None:
+            # Both attempts failed; surface the primary's outcome
+            winner = primary
+        for loser in (finished | pending) - {winner}:
+            _discard(loser)
+        if winner is hedge:
+            _bump("hedges_won")
+        return winner.result()
+
+
 def _extract_text_from_response(data) -> str:
     """Extract text from Google Generative AI API response format."""
     if not data:
@@ -132,7 +491,7 @@ def transcribe_audio_with_gemini(audio_bytes: bytes, mime_type: str, timeout: in
     """
     import base64
     
-    if not GEMINI_API_KEY:
+    if not _POOL.configured:
         logger.warning("GEMINI_API_KEY not set, returning mock transcript")
         return "This is a mocked transcript for demo purposes."
     
@@ -160,10 +519,14 @@ def transcribe_audio_with_gemini(audio_bytes: bytes, mime_type: str, timeout: in
     
     logger.info(f"Transcribing audio with Gemini API (mime_type={mime_type}, size={len(audio_bytes)} bytes)")
     
+    tier = _POOL.tiers[-1]
     try:
-        resp = _SESSION.post(GEMINI_API_URL, json=payload, timeout=timeout)
+        resp = _hedged_post(f"transcribe:{_POOL.tier_model(tier)}", lambda: _POOL.post(tier, payload, timeout, _SESSION))
         logger.debug("Transcription response status: %s", resp.status_code)
         resp.raise_for_status()
+    except UpstreamUnavailable as e:
+        logger.error("Gemini audio transcription unavailable: %s", e)
+        raise HTTPException(status_code=503, detail="All Gemini API keys are rate limited, try again later")
     except Exception as e:
         logger.error("Gemini audio transcription error: %s", e)
         if 'resp' in locals():
@@ -181,44 +544,18 @@ def transcribe_audio_with_gemini(audio_bytes: bytes, mime_type: str, timeout: in
         raise HTTPException(status_code=502, detail="Invalid transcription response")
 
 
-def call_gemini(prompt_text: str, max_tokens: int = 180, temperature: float = 0.0, timeout: int = 30) -> str:
-    """Call Gemini-like API and return a text blob. Falls back to a canned JSON for demos.
-
-    Returns a string which is either the model output or a JSON string suitable
-    for parsing by the downstream code.
-    """
-    # If no API key is configured, return a canned response
-    if not GEMINI_API_KEY:
-        logger.warning("GEMINI_API_KEY not set, returning mock response")
-        mock = {
-            "sarcasm_label": "not_sarcastic",
-            "sarcasm_intensity": 5,
-            "emotions": [{"label": "neutral", "prob": 0.8}],
-            "risk_score": 10,
-            "highlights": ["demo highlight"],
-            "explanation": "This is a mocked analysis for demo/testing purposes.",
-        }
-        return json.dumps(mock)
-
-    # Google Generative AI API payload format
-    payload = {
-        "contents": [{
-            "parts": [{
-                "text": SYSTEM_PROMPT + "\n\n" + prompt_text
-            }]
-        }],
-        "generationConfig": {
-            "temperature": temperature,
-            "maxOutputTokens": 1000,  # Increased to ensure complete JSON response
-        }
-    }
-    logger.debug("Calling Gemini API: url=%s", GEMINI_API_URL)
+def _generate(payload: dict, tier: int, timeout: int, structured: bool = False) -> str:
+    """POST a generateContent payload to `tier` of the pool and return the model text."""
+    logger.debug("Calling Gemini API: tier=%s", tier)
     logger.debug("Payload sent to Gemini API: %s", payload)
     try:
-        resp = _SESSION.post(GEMINI_API_URL, json=payload, timeout=timeout)
+        # Tiers differ in latency, so each model gets its own hedge threshold
+        resp = _hedged_post(f"generate:{_POOL.tier_model(tier)}", lambda: _POOL.post(tier, payload, timeout, _SESSION))
         logger.debug("Response status code: %s", resp.status_code)
         logger.debug("Response text: %s", resp.text[:500])
         resp.raise_for_status()
+    except UpstreamUnavailable:
+        raise
     except Exception as e:
         logger.error("Gemini API error: %s", e)
         if 'resp' in locals():
@@ -226,6 +563,15 @@ def call_gemini(prompt_text: str, max_tokens: int = 180, temperature: float = 0.
             logger.error("Response body: %s", resp.text[:500])
         raise HTTPException(status_code=502, detail=f"Gemini API error: {str(e)}")
 
+    if structured:
+        # Fast path: schema-constrained output is already clean JSON
+        try:
+            data = resp.json()
+        except ValueError:
+            raise HTTPException(status_code=502, detail="Invalid JSON response from Gemini API")
+        _record_usage("structured", data)
+        return _extract_text_from_response(data)
+
     # Attempt to obtain structured data. Providers sometimes return text with
     # surrounding commentary, so be permissive: try resp.json(), otherwise
     # attempt to extract a JSON substring from resp.text and parse that.
@@ -246,10 +592,10 @@ def call_gemini(prompt_text: str, max_tokens: int = 180, temperature: float = 0.
             raise HTTPException(status_code=502, detail="Invalid JSON response from Gemini API")
 
     logger.debug("Response from Gemini API: %s", data)
+    _record_usage("prose", data)
     text = _extract_text_from_response(data)
     # If the model returned extra commentary around the JSON, try to extract a JSON substring
     try:
-        parsed = None
         # If direct text looks like JSON, return it
         if text.strip().startswith('{'):
             return text
@@ -260,3 +606,106 @@ def call_gemini(prompt_text: str, max_tokens: int = 180, temperature: float = 0.
         return text
     except Exception:
         return text
+
+
+def _escalation_reason(text: str) -> str | None:
+    """Return why a tier's output should be escalated, or None to accept it."""
+    try:
+        parsed = json.loads(text)
+    except (TypeError, ValueError):
+        return "escalated_unparseable"
+    if not isinstance(parsed, dict):
+        return "escalated_unparseable"
+    try:
+        intensity = int(parsed.get("sarcasm_intensity"))
+    except (TypeError, ValueError):
+        return "escalated_unparseable"
+    if ESCALATE_MIN_INTENSITY <= intensity <= ESCALATE_MAX_INTENSITY:
+        return "escalated_low_confidence"
+    return None
+
+
+def call_gemini(
+    prompt_text: str,
+    max_tokens: int = 180,
+    temperature: float = 0.0,
+    timeout: int = 30,
+    schema: str | None = None,
+) -> str:
+    """Call Gemini-like API and return a text blob. Falls back to a canned JSON for demos.
+
+    Returns a string which is either the model output or a JSON string suitable
+    for parsing by the downstream code. With tiered routing enabled the
+    cheapest tier is tried first and the request escalates to stronger tiers
+    when the output fails to parse or is ambiguous.
+
+    `schema` names the endpoint ("text", "voice", "image", "video"). In
+    structured-output mode it selects the response schema and output token
+    budget, and the returned text is schema-valid JSON.
+    """
+    # If no API key is configured, return a canned response
+    if not _POOL.configured:
+        logger.warning("GEMINI_API_KEY not set, returning mock response")
+        mock = {
+            "sarcasm_label": "not_sarcastic",
+            "sarcasm_intensity": 5,
+            "emotions": [{"label": "neutral", "prob": 0.8}],
+            "risk_score": 10,
+            "highlights": ["demo highlight"],
+            "explanation": "This is a mocked analysis for demo/testing purposes.",
+        }
+        return json.dumps(mock)
+
+    structured = structured_output_for(schema)
+    system_prompt = STRUCTURED_PROMPT if structured else PROSE_SYSTEM_PROMPTS.get(schema, SYSTEM_PROMPT)
+    # Google Generative AI API payload format
+    payload = {
+        "contents": [{
+            "parts": [{
+                "text": system_prompt + "\n\n" + prompt_text
+            }]
+        }],
+        "generationConfig": {
+            "temperature": temperature,
+            "maxOutputTokens": PROSE_MAX_OUTPUT_TOKENS,  # Increased to ensure complete JSON response
+        }
+    }
+    if structured:
+        config = payload["generationConfig"]
+        config["responseMimeType"] = "application/json"
+        config["responseSchema"] = RESPONSE_SCHEMAS[schema]
+        config["maxOutputTokens"] = MAX_OUTPUT_TOKENS[schema]
+        if STRUCTURED_THINKING_BUDGET is not None:
+            config["thinkingConfig"] = {"thinkingBudget": STRUCTURED_THINKING_BUDGET}
+
+    tiers = _POOL.tiers if TIERED_ROUTING else _POOL.tiers[-1:]
+    best = None  # last usable answer from a lower tier
+    for i, tier in enumerate(tiers):
+        last = i == len(tiers) - 1
+        try:
+            text = _generate(payload, tier, timeout, structured)
+        except UpstreamUnavailable as e:
+            if not last:
+                reason = "escalated_unavailable"
+            elif best is not None:
+                return best
+            else:
+                logger.error("Gemini API unavailable: %s", e)
+                raise HTTPException(status_code=503, detail="All Gemini API keys are rate limited, try again later")
+        except HTTPException:
+            if not last:
+                reason = "escalated_error"
+            elif best is not None:
+                return best
+            else:
+                raise
+        else:
+            reason = None if last else _escalation_reason(text)
+            if reason is None:
+                return text
+            if reason == "escalated_low_confidence":
+                best = text
+        logger.info("Escalating Gemini request from tier %s (%s)", tier, reason)
+        _bump("escalations", _ROUTING_METRICS)
+        _bump(reason, _ROUTING_METRICS)
+    return best
@@ -0,0 +1,384 @@
+﻿"""Near-duplicate result cache backed by a local NumPy vector index.
+
+Texts are embedded on the CPU with signed feature hashing of character
+n-grams, so retweets with an extra emoji, lightly edited copypasta and noisy
+OCR of the same meme land close together. Lookups are approximate: SimHash
+codes (random hyperplane signs) pre-select the nearest candidates by Hamming
+distance, then exact cosine similarity decides whether the best candidate is
+above the threshold.
+
+Character n-grams barely notice the small edits that flip a sarcasm verdict
+("... today" vs "... today 🙄", "I love" vs "I do not love"), so a hit also
+requires both texts to carry the same tone markers: negations, explicit
+sarcasm markers (``/s``, ``jk``, all-caps ``NOT``) and tone-bearing emoji
+(eye-roll, upside-down face, clown, ...), raw or as the ``<annoyed>`` tags of
+the social normalizer. Emoji are left out of the embedding itself, so a
+repost that only adds a neutral or positive emoji still matches.
+
+The index has a fixed capacity with least-recently-used eviction and is
+persisted to an ``.npz`` file so it survives restarts. A small fraction of
+hits is re-analyzed in the background to measure how often cached and fresh
+results agree.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+import storage
+from social_text import EMOJI_LEXICON
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.94"))
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "10000"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "1024"))
+SEMANTIC_CACHE_PATH = Path(os.getenv("SEMANTIC_CACHE_PATH", str(storage.UPLOAD_DIR.parent / "semantic_cache.npz")))
+SEMANTIC_CACHE_VERIFY_RATE = float(os.getenv("SEMANTIC_CACHE_VERIFY_RATE", "0.05"))
+SEMANTIC_CACHE_PERSIST_EVERY = int(os.getenv("SEMANTIC_CACHE_PERSIST_EVERY", "50"))
+
+_WS_RE = re.compile(r"\s+")
+
+# Tone markers: negations, sarcasm tags and emoji whose tone can flip a verdict
+_NEGATIONS = frozenset(
+    "not no never nor none nothing nobody nowhere neither cannot without".split()
+)
+_SARCASM_MARKERS = frozenset({"/s", "/j", "/srs", "jk", "j/k", "sarcasm", "sarcastic", "yeah right"})
+# EMOJI_LEXICON tags that signal irony or disapproval; other emoji are neutral here
+TONE_EMOJI_TAGS = frozenset({
+    "ironic", "smug", "mocking", "dismissive", "clapping", "annoyed", "skeptical",
+    "unimpressed", "exasperated", "disapproving", "disgusted", "angry",
+})
+_EMOJI_CLASS = r"[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u2300-\u23FF]"
+# Emoji tags written by social_text ("<annoyed>", "<annoyed x2>")
+_TAG_PATTERN = r"<([a-z]+)(?: x\d+)?>"
+_MARKER_RE = re.compile(
+    rf"{_TAG_PATTERN}|yeah,? right|(?<!\w)/(?:s|j|srs)\b|j/k|[^\W_]+(?:['\u2019][^\W_]+)?|{_EMOJI_CLASS}",
+    re.I,
+)
+# Stripped before embedding: tone emoji are covered by the markers
+_EMOJI_STRIP_RE = re.compile(rf"{_TAG_PATTERN}|{_EMOJI_CLASS}[\uFE0F\u200D]*")
+_LAYOUT_VERSION = 2
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def tone_markers(text: str) -> frozenset:
+    """Negations, sarcasm markers and tone emoji in `text`; near-duplicates must agree on these."""
+    markers = set()
+    for m in _MARKER_RE.finditer(text):
+        tok = m.group(0)
+        if m.group(1) or (not tok[0].isalnum() and tok[0] != "/"):
+            # Emoji tag or raw emoji: only tone-bearing classes count
+            tag = m.group(1).lower() if m.group(1) else EMOJI_LEXICON.get(tok)
+            if tag in TONE_EMOJI_TAGS:
+                markers.add(tag)
+            continue
+        low = tok.lower().replace("\u2019", "'")
+        if low in _NEGATIONS or low.endswith("n't"):
+            # Shouting the negation ("... NOT.") is a sarcasm marker of its own
+            markers.add("NOT" if tok == "NOT" else "not")
+        elif low.replace(",", "") in _SARCASM_MARKERS:
+            markers.add(low.replace(",", ""))
+    return frozenset(markers)
+
+
+def _marker_id(markers: frozenset) -> int:
+    return zlib.crc32("\x1f".join(sorted(markers)).encode("utf-8"))
+
+
+class HashedNgramEmbedder:
+    """Signed hashed character n-gram embeddings, L2-normalized."""
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM, ngram_range: Tuple[int, int] = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def embed(self, text: str) -> np.ndarray:
+        norm = " " + _WS_RE.sub(" ", text.lower()).strip() + " "
+        hashes = [
+            zlib.crc32(norm[i:i + n].encode("utf-8"))
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1)
+            for i in range(max(1, len(norm) - n + 1))
+        ]
+        h = np.array(hashes, dtype=np.uint64)
+        # Low bits pick the bucket, the top bit picks the sign (reduces collisions' bias)
+        signs = np.where(h >> np.uint64(31), -1.0, 1.0)
+        vec = np.bincount((h % np.uint64(self.dim)).astype(np.int64), weights=signs, minlength=self.dim)
+        vec = vec.astype(np.float32)
+        norm_len = float(np.linalg.norm(vec))
+        return vec / norm_len if norm_len else vec
+
+
+class CacheHit:
+    __slots__ = ("payload", "similarity", "slot")
+
+    def __init__(self, payload: str, similarity: float, slot: int):
+        self.payload = payload
+        self.similarity = similarity
+        self.slot = slot
+
+
+class SemanticCache:
+    """Capacity-bounded approximate nearest-neighbor cache of analysis payloads.
+
+    Entries are partitioned by namespace (pipeline), so text and image
+    analyses of the same words never answer for each other.
+    """
+
+    def __init__(
+        self,
+        capacity: int = SEMANTIC_CACHE_CAPACITY,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        dim: int = SEMANTIC_CACHE_DIM,
+        n_bits: int = 64,
+        n_candidates: int = 32,
+        path: Optional[Path] = None,
+        verify_rate: float = SEMANTIC_CACHE_VERIFY_RATE,
+    ):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.n_candidates = n_candidates
+        self.path = path
+        self.verify_rate = verify_rate
+        self.embedder = HashedNgramEmbedder(dim)
+        self._planes = np.random.default_rng(1234).standard_normal((n_bits, dim)).astype(np.float32)
+        self._vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self._codes = np.zeros((capacity, n_bits // 8), dtype=np.uint8)
+        self._ns = np.full(capacity, -1, dtype=np.int32)
+        self._markers = np.zeros(capacity, dtype=np.int64)
+        self._last_used = np.zeros(capacity, dtype=np.float64)
+        self._payloads: list = [None] * capacity
+        self._namespaces: dict = {}
+        self._size = 0
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._verifier: Optional[ThreadPoolExecutor] = None
+        self.metrics = {
+            "lookups": 0,
+            "hits": 0,
+            "inserts": 0,
+            "evictions": 0,
+            "verifications": 0,
+            "agreements": 0,
+            "intensity_delta_sum": 0.0,
+        }
+        if path is not None:
+            self.load(path)
+
+    # -- index ------------------------------------------------------------
+
+    def _code(self, vec: np.ndarray) -> np.ndarray:
+        return np.packbits(self._planes @ vec > 0)
+
+    def _ns_id(self, namespace: str) -> int:
+        ns_id = self._namespaces.get(namespace)
+        if ns_id is None:
+            ns_id = self._namespaces[namespace] = len(self._namespaces)
+        return ns_id
+
+    def _nearest(self, ns_id: int, marker_id: int, vec: np.ndarray, code: np.ndarray) -> Tuple[int, float]:
+        """Return (slot, cosine) of the best candidate in the namespace with the same
+        tone markers, or (-1, 0.0)."""
+        n = self._size
+        live = np.flatnonzero((self._ns[:n] == ns_id) & (self._markers[:n] == marker_id))
+        if live.size == 0:
+            return -1, 0.0
+        if live.size > self.n_candidates:
+            hamming = _POPCOUNT[np.bitwise_xor(self._codes[live], code)].sum(axis=1)
+            live = live[np.argpartition(hamming, self.n_candidates)[:self.n_candidates]]
+        sims = self._vectors[live] @ vec
+        best = int(np.argmax(sims))
+        return int(live[best]), float(sims[best])
+
+    def _embed(self, text: str) -> np.ndarray:
+        return self.embedder.embed(_EMOJI_STRIP_RE.sub(" ", text))
+
+    def lookup(self, namespace: str, text: str) -> Optional[CacheHit]:
+        vec = self._embed(text)
+        code = self._code(vec)
+        marker_id = _marker_id(tone_markers(text))
+        with self._lock:
+            self.metrics["lookups"] += 1
+            ns_id = self._namespaces.get(namespace)
+            if ns_id is None:
+                return None
+            slot, sim = self._nearest(ns_id, marker_id, vec, code)
+            if slot < 0 or sim < self.threshold:
+                return None
+            self.metrics["hits"] += 1
+            self._last_used[slot] = time.time()
+            return CacheHit(self._payloads[slot], sim, slot)
+
+    def insert(self, namespace: str, text: str, payload: str) -> None:
+        vec = self._embed(text)
+        code = self._code(vec)
+        marker_id = _marker_id(tone_markers(text))
+        with self._lock:
+            ns_id = self._ns_id(namespace)
+            slot, sim = self._nearest(ns_id, marker_id, vec, code)
+            if slot < 0 or sim < self.threshold:
+                if self._size < self.capacity:
+                    slot = self._size
+                    self._size += 1
+                else:
+                    # Evict the least recently used entry
+                    slot = int(np.argmin(self._last_used))
+                    self.metrics["evictions"] += 1
+            self._vectors[slot] = vec
+            self._codes[slot] = code
+            self._ns[slot] = ns_id
+            self._markers[slot] = marker_id
+            self._last_used[slot] = time.time()
+            self._payloads[slot] = payload
+            self.metrics["inserts"] += 1
+            self._dirty += 1
+            persist = self.path is not None and self._dirty >= SEMANTIC_CACHE_PERSIST_EVERY
+        if persist:
+            threading.Thread(target=self.save, name="semantic-cache-save", daemon=True).start()
+
+    # -- agreement sampling -----------------------------------------------
+
+    def maybe_verify(
+        self,
+        hit: CacheHit,
+        fresh: Callable[[], object],
+        compare: Callable[[str, object], Optional[Tuple[bool, float]]],
+    ) -> None:
+        """With probability `verify_rate`, recompute a hit in the background and record agreement.
+
+        `compare(cached, fresh)` returns (labels_agree, abs_intensity_delta)
+        or None when the fresh result is unusable.
+        """
+        if self.verify_rate <= 0 or random.random() >= self.verify_rate:
+            return
+        if self._verifier is None:
+            with self._lock:
+                if self._verifier is None:
+                    self._verifier = ThreadPoolExecutor(max_workers=2, thread_name_prefix="semantic-verify")
+
+        def run():
+            try:
+                result = compare(hit.payload, fresh())
+            except Exception as e:
+                logger.debug("Semantic cache verification failed: %s", e)
+                return
+            if result is None:
+                return
+            agree, delta = result
+            with self._lock:
+                self.metrics["verifications"] += 1
+                self.metrics["agreements"] += int(agree)
+                self.metrics["intensity_delta_sum"] += delta
+
+        self._verifier.submit(run)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            m = dict(self.metrics)
+            size = self._size
+        verified = m.pop("verifications")
+        delta_sum = m.pop("intensity_delta_sum")
+        return {
+            **m,
+            "enabled": True,
+            "size": size,
+            "capacity": self.capacity,
+            "threshold": self.threshold,
+            "hit_rate": round(m["hits"] / m["lookups"], 4) if m["lookups"] else None,
+            "verifications": verified,
+            "agreement_rate": round(m["agreements"] / verified, 4) if verified else None,
+            "mean_intensity_delta": round(delta_sum / verified, 2) if verified else None,
+        }
+
+    # -- persistence ------------------------------------------------------
+
+    def save(self, path: Optional[Path] = None) -> None:
+        path = Path(path or self.path)
+        if not self._save_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                n = self._size
+                arrays = {
+                    "vectors": self._vectors[:n].copy(),
+                    "codes": self._codes[:n].copy(),
+                    "ns": self._ns[:n].copy(),
+                    "markers": self._markers[:n].copy(),
+                    "last_used": self._last_used[:n].copy(),
+                }
+                meta = {
+                    "version": _LAYOUT_VERSION,
+                    "dim": self.embedder.dim,
+                    "n_bits": self._planes.shape[0],
+                    "namespaces": self._namespaces,
+                    "payloads": self._payloads[:n],
+                }
+                self._dirty = 0
+            arrays["meta"] = np.frombuffer(json.dumps(meta).encode("utf-8"), dtype=np.uint8)
+            tmp = path.with_name(path.name + ".tmp.npz")
+            np.savez(tmp, **arrays)
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning("Failed to persist semantic cache to %s: %s", path, e)
+        finally:
+            self._save_lock.release()
+
+    def load(self, path: Path) -> None:
+        path = Path(path)
+        if not path.exists():
+            return
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+                if (
+                    meta["dim"] != self.embedder.dim
+                    or meta["n_bits"] != self._planes.shape[0]
+                    or meta.get("version") != _LAYOUT_VERSION
+                ):
+                    logger.info("Semantic cache at %s has a different layout; starting empty", path)
+                    return
+                # Keep the most recently used entries if capacity shrank
+                order = np.argsort(-data["last_used"])[:self.capacity]
+                n = len(order)
+                self._vectors[:n] = data["vectors"][order]
+                self._codes[:n] = data["codes"][order]
+                self._ns[:n] = data["ns"][order]
+                self._markers[:n] = data["markers"][order]
+                self._last_used[:n] = data["last_used"][order]
+            payloads = meta["payloads"]
+            for i, j in enumerate(order):
+                self._payloads[i] = payloads[int(j)]
+            self._namespaces = meta["namespaces"]
+            self._size = n
+            logger.info("Loaded %d semantic cache entries from %s", n, path)
+        except Exception as e:
+            logger.warning("Ignoring unreadable semantic cache %s: %s", path, e)
+
+
+_CACHE: Optional[SemanticCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Return the shared cache, or None when SEMANTIC_CACHE_ENABLED is off."""
+    global _CACHE
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = SemanticCache(path=SEMANTIC_CACHE_PATH)
+    return _CACHE
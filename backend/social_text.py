@@ -0,0 +1,364 @@
+﻿"""Social-media text normalizer used by the social media pipelines.
+
+Turns noisy posts into compact, model-friendly text in a single pass:
+
+* URLs collapse to ``<url>`` and mentions to ``@user`` (runs become ``x3``)
+* hashtags are word-segmented: ``#LivingTheDream`` -> ``#living-the-dream``
+* emoji map to sentiment tags: ``🙄😒`` -> ``<annoyed x2>``
+* slang/abbreviations expand through a precompiled token trie (longest match);
+  ambiguous short forms (``u``, ``r``, ``atm``) only when written in lowercase
+* elongations are squashed: ``soooo`` -> ``soo``, ``!!!!!`` -> ``!!!`` (all-caps
+  tokens such as ``III`` or ``AAA`` are kept)
+
+The tokenizer is one compiled regex scanned once per text; everything else is
+dict lookups, so the cost is linear in the input length.
+"""
+import math
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+# Emoji -> sentiment tag. Tags are single words so they stay cheap in prompts.
+EMOJI_LEXICON: Dict[str, str] = {
+    "😂": "amused", "🤣": "amused", "😆": "amused", "😹": "amused", "💀": "amused", "☠": "amused",
+    "😀": "happy", "😃": "happy", "😄": "happy", "😁": "happy", "😊": "happy", "🙂": "polite",
+    "😌": "content", "😎": "confident", "🤗": "warm", "😍": "adoring", "🥰": "adoring",
+    "😘": "affectionate", "❤": "love", "💕": "love", "💖": "love", "💔": "heartbroken",
+    "😇": "innocent", "😉": "ironic", "😜": "ironic", "🙃": "ironic", "🤪": "ironic",
+    "😏": "smug", "🤡": "mocking", "💅": "dismissive", "👏": "clapping", "✨": "emphatic",
+    "🙄": "annoyed", "😒": "annoyed", "😑": "annoyed", "😤": "annoyed", "🤨": "skeptical",
+    "🤔": "skeptical", "😐": "unimpressed", "😬": "awkward", "😅": "awkward", "🙈": "embarrassed",
+    "😳": "embarrassed", "🥲": "bittersweet", "😢": "sad", "😭": "sad", "😞": "sad", "😔": "sad",
+    "🥺": "pleading", "😩": "weary", "😫": "weary", "🥱": "bored", "😴": "bored",
+    "😡": "angry", "😠": "angry", "🤬": "angry", "🤮": "disgusted", "🤢": "disgusted",
+    "😱": "shocked", "🤯": "shocked", "😮": "surprised", "👀": "curious", "🍿": "entertained",
+    "🙏": "grateful", "👍": "approving", "👌": "approving", "✅": "approving", "💯": "emphatic",
+    "🔥": "excited", "🎉": "celebrating", "🥳": "celebrating", "🎊": "celebrating",
+    "🙌": "celebrating", "💪": "determined", "🤝": "agreeing", "👎": "disapproving",
+    "❌": "disapproving", "🚩": "warning", "⚠": "warning", "🐍": "distrustful",
+    "🤷": "indifferent", "🤦": "exasperated", "🤓": "pedantic", "☕": "gossip",
+}
+
+# Slang/abbreviation -> expansion. Keys are lowercase, space-separated tokens.
+SLANG_LEXICON: Dict[str, str] = {
+    "lol": "laughing", "lmao": "laughing hard", "lmfao": "laughing hard", "rofl": "laughing hard",
+    "smh": "shaking my head", "tbh": "to be honest", "imo": "in my opinion", "imho": "in my opinion",
+    "idk": "I don't know", "idc": "I don't care", "ikr": "I know right", "iirc": "if I recall correctly",
+    "ngl": "not gonna lie", "fr": "for real", "fr fr": "for real", "frfr": "for real",
+    "omg": "oh my god", "omfg": "oh my god", "wtf": "what the hell", "wth": "what the hell",
+    "btw": "by the way", "fyi": "for your information", "afaik": "as far as I know",
+    "jk": "just kidding", "j/k": "just kidding", "nvm": "never mind", "irl": "in real life",
+    "tfw": "that feeling when", "mfw": "my face when", "ffs": "for god's sake", "af": "very",
+    "asf": "very", "rn": "right now", "atm": "at the moment", "bc": "because", "cuz": "because",
+    "tho": "though", "thx": "thanks", "ty": "thank you", "pls": "please", "plz": "please",
+    "u": "you", "ur": "your", "r": "are", "b4": "before", "gr8": "great",
+    "l8r": "later", "w/": "with", "w/o": "without", "bday": "birthday", "bff": "best friend",
+    "dm": "direct message", "fomo": "fear of missing out", "yolo": "you only live once",
+    "sus": "suspicious", "no cap": "no lie",
+    "on god": "honestly", "low key": "somewhat", "lowkey": "somewhat", "high key": "very",
+    "highkey": "very", "deadass": "seriously", "bruh": "bro", "srsly": "seriously",
+    "obvs": "obviously", "obv": "obviously", "prolly": "probably",
+    "gonna": "going to", "wanna": "want to", "gotta": "got to", "kinda": "kind of",
+    "sorta": "sort of", "ppl": "people", "msg": "message",
+    "tl;dr": "in short", "tldr": "in short", "iykyk": "if you know you know",
+}
+
+# Short entries that are also ordinary words, initials or acronyms ("R is my
+# favorite language", "at the ATM"): expanded only when written in lowercase.
+AMBIGUOUS_SLANG = frozenset({"u", "r", "atm", "dm", "af", "ty", "bc"})
+
+# Vocabulary for hashtag segmentation, roughly ordered by frequency. A word's
+# cost grows with its rank, so common splits win ("worklife" -> "work life").
+_SEGMENT_VOCAB = """
+the a i to and of is in it you my that for on me this be so not with at just
+we your are all no have love day life best time good new one do can get more
+what like how why now out up go ever its too our yes really great happy thank
+thanks fun times work living dream goals monday friday weekend morning night blessed
+mood vibes win fail epic real true story another again because much very still
+always never every first last week year today tomorrow home family friends
+friend team world people man woman girl boy kid kids baby mom dad school
+college job boss office meeting coffee tea food pizza party music game games
+sports travel summer winter spring fall rain sun beach city car traffic
+tech life style fashion beauty fitness gym health diet weight loss sleep
+tired bored busy free sick stress stressed crazy awesome amazing perfect lucky
+sad angry mad funny cute hot cold cool nice fine okay ok wow yay ugh oops
+thing things stuff nothing something everything everyone someone nobody
+thank god oh yeah sure right wrong totally literally seriously definitely
+adulting struggle struggles problems first world problem mondays feels
+throwback thursday tbt follow like share now news fake best worst ever
+love hate it hello goodbye help me please sorry welcome back here there
+when then than them they he she his her him us do does did done make made
+take took give gave see saw look watch know think feel want need got get
+go went gone come came say said tell told let keep start stop end finish
+no yes maybe never again more less most least big small long short high
+low old young early late fast slow easy hard free full empty open close
+update software app phone internet wifi battery bug bugs code coding dev
+data cloud server down outage customer service support delivery delay
+flight airport train bus queue line wait waiting rainy sunny hot cold
+proud grateful thankful humble humbled inspired motivation motivated
+self care selfie instagood photo pic video live stream vlog blog post
+viral trend trending goals squad crew fam bae bestie queen king legend
+""".split()
+
+
+def _build_vocab(words: Iterable[str]) -> Dict[str, float]:
+    vocab: Dict[str, float] = {}
+    for rank, word in enumerate(words, start=1):
+        vocab.setdefault(word, math.log(rank + 1) + 1.0)
+    return vocab
+
+
+def _build_trie(lexicon: Dict[str, str], lowercase_only: Iterable[str] = ()) -> dict:
+    """Token-level trie.
+
+    The ``None`` key of a terminal node holds ``(expansion, lowercase_only)``.
+    """
+    lowercase_only = frozenset(lowercase_only)
+    root: dict = {}
+    for phrase, expansion in lexicon.items():
+        node = root
+        for token in phrase.split():
+            node = node.setdefault(token, {})
+        node[None] = (expansion, phrase in lowercase_only)
+    return root
+
+
+_EMOJI_CHARS = (
+    "\U0001F000-\U0001FAFF"  # pictographs, emoticons, symbols
+    "\u2600-\u27BF"  # misc symbols and dingbats
+    "\u2B00-\u2BFF"
+    "\u2300-\u23FF"
+)
+_EMOJI_MODIFIERS = "\uFE0F\U0001F3FB-\U0001F3FF"  # variation selector, skin tones
+
+_TOKEN_RE = re.compile(
+    r"(?P<url>(?:https?://|www\.)\S+)"
+    r"|(?P<mention>(?<![\w.])@\w+)"
+    r"|(?P<hashtag>#\w+)"
+    rf"|(?P<emoji>[{_EMOJI_CHARS}][{_EMOJI_MODIFIERS}]*(?:\u200D[{_EMOJI_CHARS}][{_EMOJI_MODIFIERS}]*)*)"
+    r"|(?P<word>[^\W_]+(?:['/;][^\W_]+)*/?)"
+    r"|(?P<punct>([!?.])[!?.]{2,})"
+    r"|(?P<space>\s+)"
+    r"|(?P<other>.)",
+    re.S,
+)
+_ELONGATION_RE = re.compile(r"([^\W\d_])\1{2,}")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+# Zero-width and variation characters left over between tokens
+_DROP_CHARS = frozenset("\u200D\uFE0F\uFE0E\u200B")
+
+
+class SocialTextNormalizer:
+    """Precompiled normalizer for social-media posts.
+
+    Build once and reuse: the slang trie, emoji lexicon and segmentation
+    vocabulary are compiled in the constructor.
+    """
+
+    def __init__(
+        self,
+        slang: Optional[Dict[str, str]] = None,
+        ambiguous: Optional[Iterable[str]] = None,
+        emoji: Optional[Dict[str, str]] = None,
+        vocab: Optional[Iterable[str]] = None,
+        max_hashtag_word: int = 20,
+    ):
+        self._trie = _build_trie(
+            slang if slang is not None else SLANG_LEXICON,
+            ambiguous if ambiguous is not None else AMBIGUOUS_SLANG,
+        )
+        self._emoji = emoji if emoji is not None else EMOJI_LEXICON
+        self._vocab = _build_vocab(vocab if vocab is not None else _SEGMENT_VOCAB)
+        self._max_word = min(max_hashtag_word, max(len(w) for w in self._vocab))
+        self.segment_hashtag = lru_cache(maxsize=8192)(self._segment_hashtag)
+
+    # -- hashtags ---------------------------------------------------------
+
+    def _segment_lower(self, text: str) -> Optional[List[str]]:
+        """Minimum-cost split of a lowercase run into vocabulary words (DP)."""
+        n = len(text)
+        best = [0.0] + [math.inf] * n
+        back = [0] * (n + 1)
+        vocab = self._vocab
+        for end in range(1, n + 1):
+            for start in range(max(0, end - self._max_word), end):
+                if best[start] == math.inf:
+                    continue
+                piece = text[start:end]
+                cost = vocab.get(piece)
+                if cost is None:
+                    if not piece.isdigit():
+                        continue
+                    cost = 1.0
+                total = best[start] + cost
+                if total < best[end]:
+                    best[end] = total
+                    back[end] = start
+        if best[n] == math.inf:
+            return None
+        words = []
+        end = n
+        while end > 0:
+            start = back[end]
+            words.append(text[start:end])
+            end = start
+        words.reverse()
+        return words
+
+    def _segment_hashtag(self, tag: str) -> str:
+        body = tag.lstrip("#")
+        words: List[str] = []
+        for piece in _CAMEL_RE.findall(body) or [body]:
+            lower = piece.lower()
+            if len(lower) > 3 and lower not in self._vocab:
+                words.extend(self._segment_lower(lower) or [lower])
+            else:
+                words.append(lower)
+        return "#" + "-".join(words)
+
+    # -- single text ------------------------------------------------------
+
+    def _squash(self, word: str) -> str:
+        # All-caps tokens are left alone: numerals and acronyms (III, AAA, XXX)
+        if len(word) <= 2 or word.isupper():
+            return word
+        return _ELONGATION_RE.sub(r"\1\1", word)
+
+    def normalize(self, text: str) -> str:
+        """Normalize one post. See the module docstring for the transformations."""
+        if not text:
+            return ""
+        # Output pieces; each token is preceded by a space iff the source had one
+        out: List[str] = []
+        # Pending run of collapsible tokens (urls, mentions, emoji) and its count
+        run_tag: Optional[str] = None
+        run_count = 0
+        run_spaced = False
+        # Pending words for longest-match slang lookup, with their spacing and
+        # whether each is directly followed by "." and a letter ("U.S.", "e.g.")
+        words: List[str] = []
+        spacing: List[bool] = []
+        dotted: List[bool] = []
+
+        def emit(tok: str, spaced: bool):
+            if spaced and out:
+                out.append(" ")
+            out.append(tok)
+
+        def flush_run():
+            nonlocal run_tag, run_count
+            if run_tag is not None:
+                if run_count > 1:
+                    tag = f"{run_tag[:-1]} x{run_count}>" if run_tag.endswith(">") else f"{run_tag} x{run_count}"
+                else:
+                    tag = run_tag
+                emit(tag, run_spaced)
+                run_tag, run_count = None, 0
+
+        def flush_words():
+            trie = self._trie
+            i, n = 0, len(words)
+            while i < n:
+                node, j, match, match_end = trie, i, None, i
+                while j < n:
+                    # Multi-word entries only match across whitespace
+                    if j > i and not spacing[j]:
+                        break
+                    node = node.get(words[j].lower())
+                    if node is None:
+                        break
+                    j += 1
+                    if None in node and not dotted[j - 1]:
+                        expansion, lowercase_only = node[None]
+                        if not lowercase_only or all(w.islower() for w in words[i:j]):
+                            match, match_end = expansion, j
+                if match is not None:
+                    emit(match, spacing[i])
+                    i = match_end
+                else:
+                    emit(words[i], spacing[i])
+                    i += 1
+            words.clear()
+            spacing.clear()
+            dotted.clear()
+
+        def push_run(tag: str, spaced: bool):
+            nonlocal run_tag, run_count, run_spaced
+            if words:
+                flush_words()
+            if tag == run_tag:
+                run_count += 1
+            else:
+                flush_run()
+                run_tag, run_count, run_spaced = tag, 1, spaced
+
+        emoji_lex = self._emoji
+        spaced = False
+        for m in _TOKEN_RE.finditer(text):
+            kind = m.lastgroup
+            tok = m.group(kind)
+            if kind == "space":
+                spaced = True
+                continue
+            if kind == "word":
+                flush_run()
+                words.append(self._squash(tok))
+                spacing.append(spaced)
+                end = m.end()
+                dotted.append(text[end:end + 1] == "." and text[end + 1:end + 2].isalpha())
+            elif kind == "url":
+                push_run("<url>", spaced)
+            elif kind == "mention":
+                push_run("@user", spaced)
+            elif kind == "emoji":
+                push_run(f"<{emoji_lex.get(tok[0], 'emoji')}>", spaced)
+            elif tok in _DROP_CHARS:
+                continue
+            else:
+                if words:
+                    flush_words()
+                flush_run()
+                if kind == "hashtag":
+                    tok = self.segment_hashtag(tok)
+                elif kind == "punct":
+                    tok = tok[:3]
+                emit(tok, spaced)
+            spaced = False
+        if words:
+            flush_words()
+        flush_run()
+        return "".join(out)
+
+    # -- batch ------------------------------------------------------------
+
+    def normalize_batch(self, texts: Iterable[str]) -> List[str]:
+        """Normalize many posts; exact duplicates (retweets, copypasta) are computed once."""
+        seen: Dict[str, str] = {}
+        results = []
+        normalize = self.normalize
+        for text in texts:
+            norm = seen.get(text)
+            if norm is None:
+                norm = seen[text] = normalize(text)
+            results.append(norm)
+        return results
+
+
+_DEFAULT: Optional[SocialTextNormalizer] = None
+
+
+def get_normalizer() -> SocialTextNormalizer:
+    global _DEFAULT
+    if _DEFAULT is None:
+        _DEFAULT = SocialTextNormalizer()
+    return _DEFAULT
+
+
+def normalize_social_text(text: str) -> str:
+    """Normalize one social-media post with the shared normalizer."""
+    return get_normalizer().normalize(text)
+
+
+def normalize_social_batch(texts: Iterable[str]) -> List[str]:
+    """Normalize many social-media posts with the shared normalizer."""
+    return get_normalizer().normalize_batch(texts)
@@ -1,8 +1,33 @@
-﻿"""Simple local file storage module."""
+﻿"""Media storage backends.
+
+Uploads are stored under content-addressed keys (SHA-256 of the bytes plus a
+file extension), so repeated uploads of the same media deduplicate instead of
+overwriting each other. Writes run off the event loop in a worker thread.
+
+Two backends are available:
+
+* ``LocalStorage`` writes under ``UPLOAD_DIR`` and evicts by total size and
+  file age, which keeps ``/tmp/uploads`` bounded on Vercel.
+* ``S3Storage`` talks to any S3-compatible service (AWS, MinIO, ...) via
+  boto3 and uses multipart uploads for large media.
+
+Select S3 with ``ENABLE_S3=true``; otherwise local storage is used.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import mimetypes
 import os
+import threading
+import time
+import uuid
 from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
 
-ENABLE_S3 = False
+ENABLE_S3 = os.getenv("ENABLE_S3", "false").lower() == "true"
 # Use /tmp for writable storage in serverless environments like Vercel
 if os.environ.get("VERCEL"):
     UPLOAD_DIR = Path("/tmp/uploads")
@@ -11,8 +36,271 @@ else:
 
 UPLOAD_DIR.mkdir(exist_ok=True, parents=True)
 
+# Local eviction policy
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(256 * 1024 * 1024)))
+UPLOAD_MAX_AGE_SECONDS = int(os.getenv("UPLOAD_MAX_AGE_SECONDS", str(24 * 3600)))
+UPLOAD_EVICT_INTERVAL_SECONDS = float(os.getenv("UPLOAD_EVICT_INTERVAL_SECONDS", "30"))
+
+# S3-compatible backend
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # e.g. http://localhost:9000 for MinIO
+S3_REGION = os.getenv("S3_REGION") or None
+S3_PREFIX = os.getenv("S3_PREFIX", "uploads/")
+S3_PUBLIC_URL = os.getenv("S3_PUBLIC_URL", "")  # optional CDN/public bucket base URL
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+S3_MULTIPART_CHUNKSIZE = int(os.getenv("S3_MULTIPART_CHUNKSIZE", str(8 * 1024 * 1024)))
+S3_PRESIGN_SECONDS = int(os.getenv("S3_PRESIGN_SECONDS", "3600"))
+
+
+def content_key(data: bytes, filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    """Return the content-addressed key for `data`: ``<sha256><ext>``."""
+    digest = hashlib.sha256(data).hexdigest()
+    ext = Path(filename).suffix.lower() if filename else ""
+    if not ext and content_type:
+        ext = mimetypes.guess_extension(content_type.split(";")[0].strip()) or ""
+    # Keep keys URL- and filesystem-safe
+    if not ext[1:].isalnum() or len(ext) > 10:
+        ext = ""
+    return digest + ext
+
+
+class StorageBackend:
+    """Interface shared by all storage backends.
+
+    Subclasses implement the blocking ``_put_sync``; ``put`` runs it in a
+    worker thread so callers on the event loop never block on I/O.
+    """
+
+    def _put_sync(self, data: bytes, key: str, content_type: Optional[str]) -> dict:
+        raise NotImplementedError
+
+    def put_sync(self, data: bytes, filename: Optional[str] = None, content_type: Optional[str] = None) -> dict:
+        key = content_key(data, filename, content_type)
+        result = self._put_sync(data, key, content_type)
+        result["filename"] = filename or key
+        return result
+
+    async def put(self, data: bytes, filename: Optional[str] = None, content_type: Optional[str] = None) -> dict:
+        return await asyncio.to_thread(self.put_sync, data, filename, content_type)
+
+
+class LocalStorage(StorageBackend):
+    """Content-addressed files under a local directory with size/age eviction."""
+
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int = UPLOAD_MAX_BYTES,
+        max_age_seconds: int = UPLOAD_MAX_AGE_SECONDS,
+        evict_interval: float = UPLOAD_EVICT_INTERVAL_SECONDS,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(exist_ok=True, parents=True)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.evict_interval = evict_interval
+        self._last_evict = 0.0
+        self._evict_lock = threading.Lock()
+
+    def path_for(self, key: str) -> Optional[Path]:
+        """Resolve a key to a file inside the root, rejecting path traversal."""
+        if not key or "/" in key or "\\" in key or key.startswith("."):
+            return None
+        path = self.root / key
+        return path if path.is_file() else None
+
+    def _put_sync(self, data: bytes, key: str, content_type: Optional[str]) -> dict:
+        path = self.root / key
+        deduplicated = path.exists()
+        if deduplicated:
+            # Refresh mtime so the eviction policy treats it as recently used
+            os.utime(path, None)
+        else:
+            # Write to a temp name then rename so readers never see partial files
+            tmp = self.root / f".{key}.{uuid.uuid4().hex}.tmp"
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        self.maybe_evict(keep=key)
+        return {
+            "key": key,
+            "file_path": str(path),
+            "file_url": f"/uploads/{key}",
+            "size": len(data),
+            "deduplicated": deduplicated,
+        }
+
+    def maybe_evict(self, keep: Optional[str] = None) -> None:
+        """Run eviction at most once per `evict_interval` seconds."""
+        now = time.time()
+        if now - self._last_evict < self.evict_interval:
+            return
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_evict = now
+            self.evict(keep=keep)
+        finally:
+            self._evict_lock.release()
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Delete files older than `max_age_seconds`, then oldest-first until under `max_bytes`.
+
+        Returns the number of files removed.
+        """
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.root):
+            if not entry.is_file():
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path, entry.name))
+
+        removed = 0
+        total = 0
+        survivors = []
+        for mtime, size, path, name in entries:
+            stale_tmp = name.startswith(".") and now - mtime > 3600
+            if name != keep and (stale_tmp or now - mtime > self.max_age_seconds):
+                removed += self._unlink(path)
+            else:
+                survivors.append((mtime, size, path, name))
+                total += size
+
+        survivors.sort()
+        for mtime, size, path, name in survivors:
+            if total <= self.max_bytes:
+                break
+            if name == keep or name.startswith("."):
+                continue
+            removed += self._unlink(path)
+            total -= size
+
+        if removed:
+            logger.info("Evicted %d upload(s); %d bytes retained", removed, total)
+        return removed
+
+    @staticmethod
+    def _unlink(path: str) -> int:
+        try:
+            os.unlink(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+
+class S3Storage(StorageBackend):
+    """Content-addressed objects in an S3-compatible bucket."""
+
+    def __init__(
+        self,
+        bucket: str = S3_BUCKET,
+        endpoint_url: Optional[str] = S3_ENDPOINT_URL,
+        region: Optional[str] = S3_REGION,
+        prefix: str = S3_PREFIX,
+        public_url: str = S3_PUBLIC_URL,
+        client=None,
+        transfer_config=None,
+    ):
+        if not bucket:
+            raise ValueError("S3_BUCKET must be set when ENABLE_S3=true")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.public_url = public_url.rstrip("/")
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        if transfer_config is None:
+            from boto3.s3.transfer import TransferConfig
+
+            # Objects above the threshold are sent as parallel multipart uploads
+            transfer_config = TransferConfig(
+                multipart_threshold=S3_MULTIPART_THRESHOLD,
+                multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+            )
+        self.transfer_config = transfer_config
+
+    def _exists(self, object_key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=object_key)
+            return True
+        except Exception as e:
+            # botocore's ClientError carries the service error code in `response`
+            code = (getattr(e, "response", None) or {}).get("Error", {}).get("Code")
+            if code in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+    def url_for(self, object_key: str) -> str:
+        if self.public_url:
+            return f"{self.public_url}/{object_key}"
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": object_key},
+            ExpiresIn=S3_PRESIGN_SECONDS,
+        )
+
+    def _put_sync(self, data: bytes, key: str, content_type: Optional[str]) -> dict:
+        object_key = self.prefix + key
+        deduplicated = self._exists(object_key)
+        if not deduplicated:
+            extra = {
+                # Keys are content hashes, so objects never change
+                "CacheControl": "public, max-age=31536000, immutable",
+            }
+            if content_type:
+                extra["ContentType"] = content_type
+            self.client.upload_fileobj(
+                io.BytesIO(data), self.bucket, object_key, ExtraArgs=extra, Config=self.transfer_config
+            )
+        return {
+            "key": key,
+            "file_path": f"s3://{self.bucket}/{object_key}",
+            "file_url": self.url_for(object_key),
+            "size": len(data),
+            "deduplicated": deduplicated,
+        }
+
+
+_BACKEND: Optional[StorageBackend] = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def get_storage() -> StorageBackend:
+    """Return the configured storage backend (created once, see `init_storage`)."""
+    global _BACKEND
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                _BACKEND = _create_backend()
+    return _BACKEND
+
+
+def init_storage() -> StorageBackend:
+    """Create the backend eagerly so configuration problems surface at startup."""
+    backend = get_storage()
+    logger.info("Upload storage backend: %s", type(backend).__name__)
+    return backend
+
+
+def _create_backend() -> StorageBackend:
+    if ENABLE_S3:
+        try:
+            return S3Storage()
+        except (ImportError, ValueError) as e:
+            logger.error("ENABLE_S3 is set but S3 storage is unusable (%s); falling back to %s", e, UPLOAD_DIR)
+    return LocalStorage(UPLOAD_DIR)
+
+
+async def save_upload(data: bytes, filename: Optional[str] = None, content_type: Optional[str] = None) -> dict:
+    """Store upload bytes off-thread and return key, path, url and dedup status."""
+    return await get_storage().put(data, filename, content_type)
+
 
 def save_upload_bytes(data: bytes, filename: str) -> dict:
-    filepath = UPLOAD_DIR / filename
-    filepath.write_bytes(data)
-    return {"file_path": str(filepath), "file_url": f"/uploads/{filename}", "filename": filename}
+    """Blocking variant of `save_upload` for non-async callers."""
+    return get_storage().put_sync(data, filename)
@@ -0,0 +1,438 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from fastapi import HTTPException
+
+import gemini_client
+from gemini_client import _HedgeBudget, _hedged_post, _LatencyTracker
+from upstream_pool import Upstream, UpstreamPool, UpstreamUnavailable
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None, headers=None, name=""):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self._body = body if body is not None else {}
+        self.headers = headers or {}
+        self.text = str(self._body)
+        self.name = name
+        self.closed = threading.Event()
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+    def close(self):
+        self.closed.set()
+
+
+# -- hedged requests ------------------------------------------------------
+
+@pytest.fixture
+def hedging(monkeypatch):
+    """Hedging on, with a warm 50 ms latency history and a full hedge budget."""
+    latency = _LatencyTracker()
+    for _ in range(gemini_client.HEDGE_MIN_SAMPLES):
+        latency.record("generate", 0.05)
+    budget = _HedgeBudget(rate=1.0)
+    for _ in range(5):
+        budget.deposit()
+    monkeypatch.setattr(gemini_client, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(gemini_client, "HEDGE_MIN_DELAY", 0.05)
+    monkeypatch.setattr(gemini_client, "_LATENCY", latency)
+    monkeypatch.setattr(gemini_client, "_HEDGE_BUDGET", budget)
+    for key in gemini_client._HEDGE_METRICS:
+        monkeypatch.setitem(gemini_client._HEDGE_METRICS, key, 0)
+    return budget
+
+
+def _attempts(*plans):
+    """Build a `send` whose n-th call sleeps plans[n][0] then returns/raises plans[n][1]."""
+    lock = threading.Lock()
+    calls = []
+
+    def send():
+        with lock:
+            index = len(calls)
+            calls.append(index)
+        delay, outcome = plans[index]
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    send.calls = calls
+    return send
+
+
+def test_fast_primary_is_not_hedged(hedging):
+    primary = FakeResponse(name="primary")
+    send = _attempts((0.0, primary))
+    assert _hedged_post("generate", send) is primary
+    assert send.calls == [0]
+    assert gemini_client._HEDGE_METRICS["hedges_fired"] == 0
+
+
+def test_hedge_wins_and_slow_primary_is_closed(hedging):
+    primary, hedge = FakeResponse(name="primary"), FakeResponse(name="hedge")
+    send = _attempts((0.5, primary), (0.0, hedge))
+    started = time.monotonic()
+    assert _hedged_post("generate", send) is hedge
+    assert time.monotonic() - started < 0.4
+    assert gemini_client._HEDGE_METRICS["hedges_fired"] == 1
+    assert gemini_client._HEDGE_METRICS["hedges_won"] == 1
+    assert primary.closed.wait(2)
+
+
+def test_failed_primary_loses_to_successful_hedge(hedging):
+    hedge = FakeResponse(name="hedge")
+    send = _attempts((0.15, FakeResponse(503)), (0.3, hedge))
+    assert _hedged_post("generate", send) is hedge
+    assert gemini_client._HEDGE_METRICS["hedges_won"] == 1
+
+
+def test_raising_primary_loses_to_successful_hedge(hedging):
+    hedge = FakeResponse(name="hedge")
+    send = _attempts((0.15, ConnectionError("reset")), (0.3, hedge))
+    assert _hedged_post("generate", send) is hedge
+
+
+def test_both_failing_surfaces_primary_outcome(hedging):
+    primary = FakeResponse(500, name="primary")
+    send = _attempts((0.15, primary), (0.1, FakeResponse(503, name="hedge")))
+    assert _hedged_post("generate", send) is primary
+    assert gemini_client._HEDGE_METRICS["hedges_won"] == 0
+
+
+def test_exhausted_budget_waits_for_primary(hedging, monkeypatch):
+    monkeypatch.setattr(gemini_client, "_HEDGE_BUDGET", _HedgeBudget(rate=0.0))
+    primary = FakeResponse(name="primary")
+    send = _attempts((0.2, primary))
+    assert _hedged_post("generate", send) is primary
+    assert send.calls == [0]
+    assert gemini_client._HEDGE_METRICS["hedges_skipped_budget"] == 1
+
+
+def test_concurrent_primaries_are_not_queued(hedging, monkeypatch):
+    monkeypatch.setattr(gemini_client, "HEDGE_MIN_DELAY", 1.0)
+    results = []
+
+    def call():
+        results.append(_hedged_post("generate", lambda: (time.sleep(0.3), FakeResponse())[1]))
+
+    threads = [threading.Thread(target=call) for _ in range(40)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(results) == 40
+    assert time.monotonic() - started < 0.9
+    assert gemini_client._HEDGE_METRICS["hedges_fired"] == 0
+
+
+def test_budget_refills_per_request():
+    budget = _HedgeBudget(rate=0.5, burst=1.0)
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+    for _ in range(10):
+        budget.deposit()
+    assert budget.withdraw() and not budget.withdraw()
+
+
+# -- upstream pool --------------------------------------------------------
+
+
+def _analysis(intensity=80, label="sarcastic"):
+    return {
+        "sarcasm_label": label,
+        "sarcasm_intensity": intensity,
+        "emotions": [{"label": "annoyed", "prob": 0.7}],
+        "risk_score": 20,
+        "highlights": ["great"],
+        "explanation": "x",
+    }
+
+
+def _gemini_body(text):
+    return {"candidates": [{"content": {"parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+
+class StubSession:
+    """Stands in for requests.Session; `handler(upstream_key, model, payload)` returns a FakeResponse."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.calls = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        key = (headers or {}).get("x-goog-api-key")
+        model = url.rsplit("/", 1)[-1].split(":")[0]
+        self.calls.append((key, model, json))
+        return self.handler(key, model, json)
+
+
+def _pool(keys, models=("flash",), rpm_limit=0):
+    return UpstreamPool([
+        Upstream(key, model, f"https://stub/models/{model}:generateContent", tier=tier, weight=weight,
+                 rpm_limit=rpm_limit)
+        for tier, model in enumerate(models)
+        for key, weight in keys
+    ])
+
+
+def test_weighted_least_outstanding_choice():
+    pool = _pool([("heavy", 2.0), ("light", 1.0)])
+    picks = [pool.acquire(0).key for _ in range(3)]
+    assert picks == ["heavy", "light", "heavy"]
+    light = next(u for u in pool.upstreams if u.key == "light")
+    pool.release(light, 200)
+    assert pool.acquire(0).key == "light"
+
+
+def test_rpm_quota_skips_upstream():
+    pool = _pool([("a", 1.0), ("b", 1.0)], rpm_limit=1)
+    first = pool.acquire(0)
+    pool.release(first, 200)
+    second = pool.acquire(0)
+    assert second.key != first.key
+    pool.release(second, 200)
+    with pytest.raises(UpstreamUnavailable):
+        pool.acquire(0)
+
+
+def test_429_drains_upstream(monkeypatch):
+    pool = _pool([("a", 1.0), ("b", 1.0)])
+    a = next(u for u in pool.upstreams if u.key == "a")
+    pool.acquire(0)  # a
+    pool.release(a, 429, retry_after=30)
+    snapshot = {row["upstream"]: row for row in pool.snapshot()}
+    assert snapshot["flash/...a"]["throttled"] == 1
+    assert 29 <= snapshot["flash/...a"]["drained_for_s"] <= 30
+    assert all(pool.acquire(0).key == "b" for _ in range(3))
+
+
+def test_post_fails_over_on_429_and_raises_when_tier_exhausted():
+    pool = _pool([("k429", 1.0), ("kA", 1.0)])
+    session = StubSession(lambda key, model, payload: FakeResponse(429, headers={"Retry-After": "30"})
+                          if key == "k429" else FakeResponse(200))
+    assert pool.post(0, {}, 5, session).status_code == 200
+    assert [c[0] for c in session.calls] == ["k429", "kA"]
+
+    throttled = StubSession(lambda key, model, payload: FakeResponse(429))
+    with pytest.raises(UpstreamUnavailable):
+        _pool([("a", 1.0), ("b", 1.0)]).post(0, {}, 5, throttled)
+    assert len(throttled.calls) == 2
+
+
+@pytest.fixture
+def stub_upstream():
+    """Local HTTP server: key k429 answers 429 with Retry-After: 30, any other key 200."""
+    hits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            key = self.headers.get("x-goog-api-key")
+            hits.append(key)
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if key == "k429":
+                body, status, extra = b"{}", 429, {"Retry-After": "30"}
+            else:
+                body, status, extra = json.dumps(_gemini_body("ok")).encode(), 200, {}
+            self.send_response(status)
+            for name, value in extra.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", hits
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_does_not_sleep_on_retry_after(stub_upstream):
+    base, hits = stub_upstream
+    pool = UpstreamPool([
+        Upstream(key, "flash", f"{base}/models/flash:generateContent", tier=0) for key in ("k429", "kA")
+    ])
+    started = time.monotonic()
+    resp = pool.post(0, {"contents": []}, 5, gemini_client._create_session())
+    assert resp.status_code == 200
+    assert time.monotonic() - started < 2
+    assert hits == ["k429", "kA"]
+
+
+# -- tiered routing -------------------------------------------------------
+
+@pytest.fixture
+def routing(monkeypatch):
+    """Install a two-tier pool (lite, flash) with tiered routing; returns a setter for the stub session."""
+    monkeypatch.setattr(gemini_client, "TIERED_ROUTING", True)
+    monkeypatch.setattr(gemini_client, "STRUCTURED_OUTPUT", False)
+    monkeypatch.setattr(gemini_client, "_POOL", _pool([("key1", 1.0)], models=("lite", "flash")))
+    for key in gemini_client._ROUTING_METRICS:
+        monkeypatch.setitem(gemini_client._ROUTING_METRICS, key, 0)
+
+    def install(handler):
+        session = StubSession(handler)
+        monkeypatch.setattr(gemini_client, "_SESSION", session)
+        return session
+
+    return install
+
+
+def _answers(by_model):
+    def handler(key, model, payload):
+        answer = by_model[model]
+        if isinstance(answer, FakeResponse):
+            return answer
+        text = answer if isinstance(answer, str) else json.dumps(answer)
+        return FakeResponse(200, _gemini_body(text))
+    return handler
+
+
+def test_confident_cheap_tier_is_accepted(routing):
+    session = routing(_answers({"lite": _analysis(90), "flash": _analysis(10)}))
+    assert json.loads(gemini_client.call_gemini("hi"))["sarcasm_intensity"] == 90
+    assert [c[1] for c in session.calls] == ["lite"]
+
+
+@pytest.mark.parametrize(
+    "lite, reason",
+    [
+        (_analysis(50), "escalated_low_confidence"),
+        ("not json at all", "escalated_unparseable"),
+        (FakeResponse(500), "escalated_error"),
+        (FakeResponse(429), "escalated_unavailable"),
+    ],
+)
+def test_escalates_to_stronger_tier(routing, lite, reason):
+    session = routing(_answers({"lite": lite, "flash": _analysis(90)}))
+    assert json.loads(gemini_client.call_gemini("hi"))["sarcasm_intensity"] == 90
+    assert [c[1] for c in session.calls][-1] == "flash"
+    assert gemini_client._ROUTING_METRICS[reason] == 1
+    assert gemini_client._ROUTING_METRICS["escalations"] == 1
+
+
+def test_ambiguous_answer_kept_when_strong_tier_is_throttled(routing):
+    routing(_answers({"lite": _analysis(50), "flash": FakeResponse(429)}))
+    assert json.loads(gemini_client.call_gemini("hi"))["sarcasm_intensity"] == 50
+
+
+def test_all_tiers_throttled_is_503(routing):
+    routing(_answers({"lite": FakeResponse(429), "flash": FakeResponse(429)}))
+    with pytest.raises(HTTPException) as exc:
+        gemini_client.call_gemini("hi")
+    assert exc.value.status_code == 503
+    assert gemini_client._ROUTING_METRICS["escalated_unavailable"] == 1
+
+
+# -- prompts and structured output ----------------------------------------
+
+@pytest.fixture
+def single_tier(monkeypatch):
+    """One upstream answering a fixed analysis; returns the stub session to inspect payloads."""
+    monkeypatch.setattr(gemini_client, "TIERED_ROUTING", False)
+    monkeypatch.setattr(gemini_client, "_POOL", _pool([("key1", 1.0)]))
+    session = StubSession(lambda key, model, payload: FakeResponse(200, _gemini_body(json.dumps(_analysis()))))
+    monkeypatch.setattr(gemini_client, "_SESSION", session)
+    return session
+
+
+def _sent_prompt(session):
+    return session.calls[-1][2]["contents"][0]["parts"][0]["text"]
+
+
+def test_prose_video_prompt_asks_for_timestamps(single_tier, monkeypatch):
+    monkeypatch.setattr(gemini_client, "STRUCTURED_OUTPUT", False)
+    gemini_client.call_gemini("video prompt", schema="video")
+    assert "timestamps_explanations" in _sent_prompt(single_tier)
+    gemini_client.call_gemini("text prompt", schema="text")
+    assert _sent_prompt(single_tier).startswith(gemini_client.SYSTEM_PROMPT)
+
+
+@pytest.mark.parametrize("schema", ["text", "voice", "image", "video"])
+def test_structured_payload(single_tier, monkeypatch, schema):
+    monkeypatch.setattr(gemini_client, "STRUCTURED_OUTPUT", True)
+    monkeypatch.setattr(gemini_client, "STRUCTURED_THINKING_BUDGET", None)
+    text = gemini_client.call_gemini("prompt", schema=schema)
+    assert json.loads(text)["sarcasm_label"] == "sarcastic"
+    config = single_tier.calls[-1][2]["generationConfig"]
+    assert config["responseMimeType"] == "application/json"
+    assert config["responseSchema"] is gemini_client.RESPONSE_SCHEMAS[schema]
+    assert config["maxOutputTokens"] == gemini_client.MAX_OUTPUT_TOKENS[schema]
+    assert "thinkingConfig" not in config
+    assert _sent_prompt(single_tier).startswith(gemini_client.STRUCTURED_PROMPT)
+
+
+def test_thinking_budget_only_when_configured(single_tier, monkeypatch):
+    monkeypatch.setattr(gemini_client, "STRUCTURED_OUTPUT", True)
+    monkeypatch.setattr(gemini_client, "STRUCTURED_THINKING_BUDGET", 0)
+    gemini_client.call_gemini("prompt", schema="text")
+    assert single_tier.calls[-1][2]["generationConfig"]["thinkingConfig"] == {"thinkingBudget": 0}
+
+
+def test_prose_payload_has_no_schema(single_tier, monkeypatch):
+    monkeypatch.setattr(gemini_client, "STRUCTURED_OUTPUT", False)
+    gemini_client.call_gemini("prompt", schema="text")
+    config = single_tier.calls[-1][2]["generationConfig"]
+    assert config["maxOutputTokens"] == gemini_client.PROSE_MAX_OUTPUT_TOKENS
+    assert "responseSchema" not in config and "thinkingConfig" not in config
+
+
+def test_voice_schema_does_not_require_timestamps():
+    voice = gemini_client.RESPONSE_SCHEMAS["voice"]
+    assert "timestamps_explanations" in voice["properties"]
+    assert "timestamps_explanations" not in voice["required"]
+    assert "t" not in voice["properties"]["timestamps_explanations"]["items"]["properties"]
+    assert "timestamps_explanations" in gemini_client.RESPONSE_SCHEMAS["video"]["required"]
+
+
+@pytest.mark.parametrize(
+    "text, reason",
+    [
+        (json.dumps(_analysis(90)), None),
+        (json.dumps(_analysis(10)), None),
+        (json.dumps(_analysis(40)), "escalated_low_confidence"),
+        (json.dumps(_analysis(60)), "escalated_low_confidence"),
+        ('{"sarcasm_label": "sarcastic"}', "escalated_unparseable"),
+        ('{"sarcasm_intensity": "high"}', "escalated_unparseable"),
+        ("[1, 2]", "escalated_unparseable"),
+        ("Sure! Here is the JSON", "escalated_unparseable"),
+    ],
+)
+def test_escalation_reason(text, reason):
+    assert gemini_client._escalation_reason(text) == reason
+
+
+def test_structured_usage_metrics(single_tier, monkeypatch):
+    monkeypatch.setattr(gemini_client, "STRUCTURED_OUTPUT", True)
+    for counters in gemini_client._OUTPUT_METRICS.values():
+        for key in counters:
+            monkeypatch.setitem(counters, key, 0)
+    body = _gemini_body(json.dumps(_analysis()))
+    body["usageMetadata"] = {"candidatesTokenCount": 42}
+    body["candidates"][0]["finishReason"] = "MAX_TOKENS"
+    single_tier.handler = lambda key, model, payload: FakeResponse(200, body)
+    gemini_client.call_gemini("prompt", schema="image")
+    gemini_client.record_parse(True, True)
+    structured = gemini_client.get_output_metrics()["structured"]
+    assert structured["calls"] == 1 and structured["output_tokens"] == 42 and structured["truncated"] == 1
+    assert structured["parse_failure_rate"] == 0.0
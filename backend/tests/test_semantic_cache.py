@@ -0,0 +1,115 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app
+from semantic_cache import SEMANTIC_CACHE_THRESHOLD, SemanticCache, tone_markers
+
+BASE = "Great job on the presentation today"
+
+
+def _cache(capacity=64, **kwargs):
+    return SemanticCache(capacity=capacity, verify_rate=0.0, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "cached, query",
+    [
+        (BASE, BASE + " 🙄"),
+        (BASE, BASE + ". NOT."),
+        (BASE + ". Not.", BASE + ". NOT."),
+        ("I love working on weekends, it's the best", "I do not love working on weekends, it's the best"),
+        ("I love working on weekends, it's the best", "I don't love working on weekends, it's the best"),
+        ("Oh sure, that went really well", "Oh sure, that went really well /s"),
+        ("Had a great time at the party last night 🎉", "Had a great time at the party last night 🙃"),
+    ],
+)
+def test_tone_flipping_edits_miss(cached, query):
+    cache = _cache(threshold=0.0)  # even a permissive threshold must not match
+    cache.insert("text", cached, '{"sarcasm_label": "not_sarcastic"}')
+    assert cache.lookup("text", query) is None
+    assert cache.lookup("text", cached) is not None
+
+
+@pytest.mark.parametrize(
+    "cached, query",
+    [
+        (BASE, BASE + "!"),
+        (BASE, BASE.lower()),
+        (BASE + " 🙄", BASE + "  🙄"),
+        # Neutral or positive emoji do not change the tone
+        ("Great game tonight", "Great game tonight 🔥"),
+        ("Had a great time at the party last night 🎉", "Had a great time at the party last night 🥳🔥"),
+        ("I don't love working on weekends", "i don't  love working on weekends"),
+    ],
+)
+def test_near_duplicates_hit(cached, query):
+    cache = _cache()
+    cache.insert("text", cached, "payload")
+    hit = cache.lookup("text", query)
+    assert hit is not None and hit.payload == "payload"
+    assert hit.similarity >= SEMANTIC_CACHE_THRESHOLD
+
+
+def test_namespaces_are_isolated():
+    cache = _cache()
+    cache.insert("text", BASE, "payload")
+    assert cache.lookup("image", BASE) is None
+
+
+def test_tone_markers():
+    assert tone_markers("I can’t even") == {"not"}
+    assert tone_markers("Great. NOT.") == {"NOT"}
+    assert tone_markers("yeah, right /s 👍🏽") == {"yeah right", "/s"}
+    assert tone_markers("nice 🙄 🙃 🔥 🎉") == {"annoyed", "ironic"}
+    # Tags written by the social normalizer count like the raw emoji
+    assert tone_markers("nice <annoyed x2> <excited> <url>") == {"annoyed"}
+    assert tone_markers("knot a/s") == frozenset()
+
+
+def test_lru_eviction_and_persistence(tmp_path):
+    path = tmp_path / "cache.npz"
+    cache = _cache(capacity=2, path=path)
+    cache.insert("text", "first post about coffee", "1")
+    cache.insert("text", "second post about traffic jams", "2")
+    cache.lookup("text", "first post about coffee")
+    cache.insert("text", "third post about the weather today", "3")
+    assert cache.lookup("text", "second post about traffic jams") is None
+    cache.save()
+
+    reloaded = _cache(capacity=2, path=path)
+    assert reloaded.lookup("text", "first post about coffee").payload == "1"
+    assert reloaded.lookup("text", "third post about the weather today").payload == "3"
+
+
+def test_social_pipeline_keeps_tone_markers(monkeypatch):
+    """Social inputs are normalized (emoji -> <tags>) before the cache sees them."""
+    cache = _cache()
+    monkeypatch.setattr(app, "get_semantic_cache", lambda: cache)
+    verdicts = iter([("not_sarcastic", 5), ("sarcastic", 85)])
+
+    def fake_gemini(prompt_text, schema=None, **kwargs):
+        label, intensity = next(verdicts)
+        return json.dumps({
+            "sarcasm_label": label, "sarcasm_intensity": intensity, "emotions": [],
+            "risk_score": 0, "highlights": [], "explanation": "x",
+        })
+
+    monkeypatch.setattr(app, "call_gemini", fake_gemini)
+    post = "Great job on the presentation today, really loved how it went with the whole team"
+    processed = app.preprocess_social_media(post + " 🙄")
+    assert "<annoyed>" in processed
+
+    first = app._cached_analysis("social", app.preprocess_social_media(post) + "\n", "p", "text")
+    second = app._cached_analysis("social", processed + "\n", "p", "text")
+    assert first["sarcasm_label"] == "not_sarcastic"
+    assert second["sarcasm_label"] == "sarcastic"
+
+    client = TestClient(app.app)
+    resp = client.post("/api/analyze", json={"text": post + " 🙄🙄"}, headers={"X-Domain": "social_media"})
+    assert resp.status_code == 200
+    assert resp.json()["sarcasm_label"] == "Sarcastic Post"
+    # A positive emoji on the original post is still a hit
+    hit = app._cached_analysis("social", app.preprocess_social_media(post + " 🔥") + "\n", "p", "text")
+    assert hit["sarcasm_label"] == "not_sarcastic"
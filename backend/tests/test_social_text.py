@@ -0,0 +1,46 @@
+import pytest
+
+from social_text import SocialTextNormalizer, normalize_social_text
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        # Content that looks like slang must survive untouched
+        ("R is my favorite language, U.S. politics", "R is my favorite language, U.S. politics"),
+        ("at the ATM", "at the ATM"),
+        ("u.s. politics", "u.s. politics"),
+        ("email me at a@b.com", "email me at a@b.com"),
+        # Lowercase slang still expands
+        ("u r so right lol", "you are so right laughing"),
+        ("hit me up in dm btw", "hit me up in direct message by the way"),
+        ("thx @dev!", "thanks @user!"),
+    ],
+)
+def test_slang_and_mentions(text, expected):
+    assert normalize_social_text(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("Chapter III was good", "Chapter III was good"),
+        ("AAA batteries and XXX", "AAA batteries and XXX"),
+        ("soooo goooood", "soo good"),
+        ("Sooooo", "Soo"),
+    ],
+)
+def test_elongation_keeps_all_caps_tokens(text, expected):
+    assert normalize_social_text(text) == expected
+
+
+def test_runs_emoji_and_hashtags():
+    assert normalize_social_text("soooo great 🙄🙄 @a @b #LivingTheDream") == (
+        "soo great <annoyed x2> @user x2 #living-the-dream"
+    )
+
+
+def test_batch_matches_single():
+    normalizer = SocialTextNormalizer()
+    posts = ["tbh idk 😂", "tbh idk 😂", "ok https://t.co/x https://t.co/y"]
+    assert normalizer.normalize_batch(posts) == [normalizer.normalize(p) for p in posts]
@@ -0,0 +1,180 @@
+import asyncio
+import io
+import os
+import time
+
+import pytest
+
+import storage
+from app import _etag_matches, _parse_byte_range
+from storage import LocalStorage, S3Storage, content_key
+
+
+# -- Range / conditional request parsing ----------------------------------
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        (None, None),
+        ("bytes=0-99", (0, 99)),
+        ("bytes=10-", (10, 999)),  # open-ended
+        ("bytes=-100", (900, 999)),  # suffix
+        ("bytes=-5000", (0, 999)),  # suffix longer than the file
+        ("bytes=900-5000", (900, 999)),  # end clamped to the file size
+        ("bytes=1000-", False),  # starts past the end
+        ("bytes=50-10", False),
+        ("bytes=-0", False),
+        ("bytes=0-1,5-6", None),  # multi-range: serve the whole file
+        ("items=0-1", None),
+        ("bytes=a-b", None),
+    ],
+)
+def test_parse_byte_range(header, expected):
+    assert _parse_byte_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"x", W/"abc"', True),
+        ("*", True),
+        ('"abcd"', False),
+        ("", False),
+        (None, False),
+    ],
+)
+def test_etag_matches(header, expected):
+    assert _etag_matches(header, '"abc"') is expected
+
+
+# -- LocalStorage ---------------------------------------------------------
+
+def test_content_key_is_stable_and_sanitized():
+    key = content_key(b"hello", "Photo.PNG")
+    assert key == content_key(b"hello", "other.png")
+    assert key.endswith(".png")
+    assert "/" not in content_key(b"hello", "x.p/g")
+
+
+def test_local_storage_deduplicates(tmp_path):
+    backend = LocalStorage(tmp_path, evict_interval=0)
+    first = backend.put_sync(b"same bytes", "a.png")
+    second = asyncio.run(backend.put(b"same bytes", "b.png"))
+    assert first["key"] == second["key"]
+    assert first["deduplicated"] is False
+    assert second["deduplicated"] is True
+    assert [p.name for p in tmp_path.iterdir()] == [first["key"]]
+    assert backend.path_for(first["key"]) is not None
+
+
+def test_local_storage_rejects_traversal(tmp_path):
+    backend = LocalStorage(tmp_path)
+    (tmp_path.parent / "secret.txt").write_text("x")
+    for key in ("../secret.txt", "..", ".hidden", "a\\b", ""):
+        assert backend.path_for(key) is None
+
+
+def test_local_storage_evicts_by_age(tmp_path):
+    backend = LocalStorage(tmp_path, max_age_seconds=60, evict_interval=0)
+    old = backend.put_sync(b"old", "old.txt")
+    past = time.time() - 120
+    os.utime(tmp_path / old["key"], (past, past))
+    new = backend.put_sync(b"new", "new.txt")
+    assert not (tmp_path / old["key"]).exists()
+    assert (tmp_path / new["key"]).exists()
+
+
+def test_local_storage_evicts_oldest_over_size_budget(tmp_path):
+    backend = LocalStorage(tmp_path, max_bytes=250, evict_interval=3600)
+    keys = []
+    for i in range(3):
+        keys.append(backend.put_sync(bytes([i]) * 100, f"{i}.bin")["key"])
+        stamp = time.time() - 100 + i
+        os.utime(tmp_path / keys[-1], (stamp, stamp))
+    assert backend.evict(keep=keys[-1]) == 1
+    assert not (tmp_path / keys[0]).exists()
+    assert (tmp_path / keys[1]).exists()
+    assert (tmp_path / keys[2]).exists()
+
+
+def test_get_storage_falls_back_to_local_without_boto3(monkeypatch):
+    monkeypatch.setattr(storage, "ENABLE_S3", True)
+    monkeypatch.setattr(storage, "_BACKEND", None)
+
+    def unavailable(*args, **kwargs):
+        raise ImportError("No module named 'boto3'")
+
+    monkeypatch.setattr(storage, "S3Storage", unavailable)
+    assert isinstance(storage.init_storage(), LocalStorage)
+
+
+# -- S3Storage against an in-memory S3 stand-in ----------------------------
+
+class _NotFound(Exception):
+    """Mimics botocore's ClientError for a missing object."""
+
+    response = {"Error": {"Code": "404"}}
+
+
+class FakeS3Client:
+    def __init__(self):
+        self.objects = {}
+        self.uploads = 0
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise _NotFound()
+        return {"ContentLength": len(self.objects[(Bucket, Key)][0])}
+
+    def upload_fileobj(self, fileobj, Bucket, Key, ExtraArgs=None, Config=None):
+        self.uploads += 1
+        self.objects[(Bucket, Key)] = (fileobj.read(), dict(ExtraArgs or {}), Config)
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.test/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+def _s3(**kwargs):
+    return S3Storage(bucket="media", prefix="uploads/", client=FakeS3Client(), transfer_config="cfg", **kwargs)
+
+
+def test_s3_storage_uploads_once_and_deduplicates():
+    backend = _s3()
+    first = backend.put_sync(b"clip", "a.mp3", "audio/mpeg")
+    second = backend.put_sync(b"clip", "b.mp3", "audio/mpeg")
+    assert backend.client.uploads == 1
+    assert first["deduplicated"] is False and second["deduplicated"] is True
+    body, extra, config = backend.client.objects[("media", "uploads/" + first["key"])]
+    assert body == b"clip"
+    assert extra["ContentType"] == "audio/mpeg"
+    assert "immutable" in extra["CacheControl"]
+    assert config == "cfg"
+    assert first["file_path"] == f"s3://media/uploads/{first['key']}"
+    assert first["file_url"].startswith("https://s3.test/media/uploads/")
+
+
+def test_s3_storage_public_url():
+    backend = _s3(public_url="https://cdn.test/")
+    result = backend.put_sync(b"img", "x.png")
+    assert result["file_url"] == f"https://cdn.test/uploads/{result['key']}"
+
+
+def test_s3_storage_propagates_other_errors():
+    backend = _s3()
+
+    class Denied(Exception):
+        response = {"Error": {"Code": "403"}}
+
+    def head_object(**kwargs):
+        raise Denied()
+
+    backend.client.head_object = head_object
+    with pytest.raises(Denied):
+        backend.put_sync(b"x", "x.bin")
+
+
+def test_s3_storage_requires_bucket():
+    with pytest.raises(ValueError):
+        S3Storage(bucket="", client=FakeS3Client(), transfer_config="cfg")
@@ -0,0 +1,42 @@
+from text_windows import TextWindow, merge_window_results, split_windows
+
+
+def _overlaps(windows):
+    return [a.end - b.start for a, b in zip(windows, windows[1:])]
+
+
+def test_windows_share_a_sentence():
+    text = ". ".join(f"This is sentence number {i}" for i in range(200)) + "."
+    windows = split_windows(text, 500, overlap_sentences=1)
+    assert len(windows) > 1
+    assert all(w.end - w.start <= 500 for w in windows)
+    assert all(overlap > 0 for overlap in _overlaps(windows))
+    assert windows[0].start == 0 and windows[-1].end == len(text)
+
+
+def test_cut_sentence_gets_character_overlap():
+    # One sentence far longer than a window: it is cut at whitespace
+    text = " ".join(["alpha", "beta", "gamma", "delta"] * 200) + "."
+    windows = split_windows(text, 500, overlap_sentences=1)
+    assert len(windows) > 2
+    assert all(20 <= overlap <= 50 for overlap in _overlaps(windows))
+    assert all(text[w.start - 1] == " " for w in windows[1:])
+
+
+def test_max_windows_is_respected():
+    text = ". ".join(f"Sentence {i} goes here" for i in range(500)) + "."
+    assert len(split_windows(text, 200, overlap_sentences=1, max_windows=4)) <= 4
+
+
+def test_merge_uses_peak_window():
+    windows = [TextWindow(0, 0, 100, "a"), TextWindow(1, 90, 200, "b")]
+    base = {"emotions": [{"label": "neutral", "prob": 1.0}], "explanation": "x"}
+    payloads = [
+        {**base, "sarcasm_label": "not_sarcastic", "sarcasm_intensity": 10, "risk_score": 5, "highlights": ["meh"]},
+        {**base, "sarcasm_label": "sarcastic", "sarcasm_intensity": 90, "risk_score": 40, "highlights": ["great"]},
+    ]
+    merged = merge_window_results(windows, payloads)
+    assert merged["sarcasm_label"] == "sarcastic"
+    assert merged["risk_score"] == 40
+    assert merged["highlights"][0] == "great"
+    assert [w["index"] for w in merged["windows"]] == [0, 1]
@@ -0,0 +1,43 @@
+import io
+
+import video_utils
+from video_utils import keyframe_times, spread_timestamps
+
+
+def test_spread_keeps_all_when_under_cap():
+    assert spread_timestamps([5.0, 0.0, 2.0, 2.0], 10.0, 12) == [0.0, 2.0, 5.0]
+
+
+def test_spread_covers_whole_duration():
+    # Dense cuts early on, a few late ones: the late part must still be sampled
+    times = [i * 0.5 for i in range(100)] + [80.0, 95.0, 119.0]
+    chosen = spread_timestamps(times, 120.0, 6)
+    assert len(chosen) == 6
+    assert chosen[0] == 0.0
+    assert chosen[-1] == 119.0
+    assert any(t >= 80.0 for t in chosen[:-1])
+
+
+class _FakePopen:
+    def __init__(self, args, stdout=None, stderr=None):
+        self.args = args
+        lines = [f"[Parsed_showinfo_2] n:{i} pts:{i} pts_time:{t}\n" for i, t in enumerate(self.cuts)]
+        self.stderr = io.BytesIO("".join(lines).encode())
+
+    def poll(self):
+        return 0
+
+    def kill(self):
+        pass
+
+    def wait(self):
+        return 0
+
+
+def test_keyframe_times_reads_every_scene_change(monkeypatch):
+    _FakePopen.cuts = [float(t) for t in range(3, 300, 3)]  # 99 cuts over 5 minutes
+    monkeypatch.setattr(video_utils.subprocess, "Popen", _FakePopen)
+    times = keyframe_times("clip.mp4", 300.0, max_frames=12)
+    assert len(times) == 12
+    assert times[0] == 0.0
+    assert times[-1] >= 290.0
@@ -0,0 +1,158 @@
+﻿"""Sentence-aligned windowing and result pooling for long text inputs.
+
+Long articles and threads are split into overlapping windows that end on
+sentence boundaries, each window is scored independently, and the per-window
+analyses are merged back into a single response payload.
+"""
+import math
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# A sentence runs up to terminal punctuation (plus closing quotes/brackets) or a line break
+_SENTENCE_RE = re.compile(r"[^.!?\n]*(?:[.!?]+[\"')\]]*|\n+|$)")
+
+
+@dataclass
+class TextWindow:
+    index: int
+    start: int  # character offset into the original text (inclusive)
+    end: int  # character offset into the original text (exclusive)
+    text: str
+
+
+def split_sentences(text: str, max_chars: int) -> List[Tuple[int, int]]:
+    """Return (start, end) spans of sentences; sentences over `max_chars` are split at whitespace."""
+    spans = []
+    for m in _SENTENCE_RE.finditer(text):
+        start, end = m.span()
+        while start < end and text[start].isspace():
+            start += 1
+        if start == end:
+            continue
+        while end - start > max_chars:
+            cut = text.rfind(" ", start + 1, start + max_chars)
+            if cut <= start:
+                cut = start + max_chars
+            spans.append((start, cut))
+            start = cut
+        spans.append((start, end))
+    return spans
+
+
+def split_windows(text: str, window_chars: int, overlap_sentences: int = 1, max_windows: int = 0) -> List[TextWindow]:
+    """Split `text` into sentence-aligned windows of at most ~`window_chars` characters.
+
+    Consecutive windows share `overlap_sentences` sentences so sarcasm that
+    spans a boundary is still seen whole; where a boundary cuts an over-long
+    sentence they share about a tenth of a window of text instead. When `max_windows` is set the
+    window size grows as needed to stay within that many windows.
+    """
+    windows = _split_windows(text, window_chars, overlap_sentences)
+    while max_windows and len(windows) > max_windows:
+        window_chars = math.ceil(window_chars * 1.25)
+        windows = _split_windows(text, window_chars, overlap_sentences)
+    return windows
+
+
+def _split_windows(text: str, window_chars: int, overlap_sentences: int) -> List[TextWindow]:
+    sentences = split_sentences(text, window_chars)
+    # Where a boundary cuts an over-long sentence there is no whole sentence to
+    # share, so the next window repeats this many trailing characters instead
+    overlap_chars = window_chars // 10 if overlap_sentences else 0
+    windows: List[TextWindow] = []
+    i = 0
+    carry = None  # start offset stepped back into the previous window
+    while i < len(sentences):
+        j = i
+        start = sentences[i][0] if carry is None else carry
+        while j < len(sentences) and (j == i or sentences[j][1] - start <= window_chars):
+            j += 1
+        end = sentences[j - 1][1]
+        windows.append(TextWindow(index=len(windows), start=start, end=end, text=text[start:end].strip()))
+        if j >= len(sentences):
+            break
+        # Step back for overlap, but always make progress
+        next_i = max(i + 1, j - overlap_sentences)
+        carry = None
+        if next_i == j and overlap_chars and sentences[j][0] == end:
+            cut = text.find(" ", max(start, end - overlap_chars), end)
+            if cut > start:
+                carry = cut + 1
+        i = next_i
+    return windows
+
+
+def merge_window_results(windows: List[TextWindow], payloads: List[dict], max_highlights: int = 10) -> dict:
+    """Pool per-window analyses (normalized payloads) into one payload.
+
+    * risk_score: max over windows (the worst passage sets the risk)
+    * sarcasm_intensity: mean of the peak and the length-weighted average, so a
+      single sarcastic aside scores high but below uniformly sarcastic text
+    * sarcasm_label / explanation: from the most sarcastic window
+    * emotions: length-weighted average probability per label
+    * highlights: union ranked by the intensity of the windows citing them
+    """
+    weights = [max(1, w.end - w.start) for w in windows]
+    total_weight = sum(weights)
+    intensities = [p["sarcasm_intensity"] for p in payloads]
+    peak = max(range(len(payloads)), key=lambda k: (intensities[k], payloads[k]["risk_score"]))
+    weighted_intensity = sum(i * w for i, w in zip(intensities, weights)) / total_weight
+
+    emotion_mass: dict = {}
+    for payload, weight in zip(payloads, weights):
+        for emotion in payload["emotions"]:
+            if not isinstance(emotion, dict) or "label" not in emotion:
+                continue
+            try:
+                prob = float(emotion.get("prob", 0.0))
+            except (TypeError, ValueError):
+                continue
+            label = str(emotion["label"]).lower()
+            emotion_mass[label] = emotion_mass.get(label, 0.0) + prob * weight
+    emotions = [
+        {"label": label, "prob": round(mass / total_weight, 3)}
+        for label, mass in sorted(emotion_mass.items(), key=lambda kv: -kv[1])[:5]
+    ]
+
+    highlight_scores: dict = {}
+    highlight_text: dict = {}
+    for payload in payloads:
+        for phrase in payload["highlights"]:
+            if not isinstance(phrase, str) or not phrase.strip():
+                continue
+            key = phrase.strip().lower()
+            highlight_text.setdefault(key, phrase.strip())
+            highlight_scores[key] = highlight_scores.get(key, 0) + 1 + payload["sarcasm_intensity"]
+    highlights = [highlight_text[k] for k, _ in sorted(highlight_scores.items(), key=lambda kv: -kv[1])]
+
+    top = windows[peak]
+    explanation = payloads[peak]["explanation"].strip()
+    explanation = (
+        f"{explanation} (Long input analyzed in {len(windows)} windows; "
+        f"strongest signal in characters {top.start}-{top.end}.)"
+    ).strip()
+
+    return {
+        "sarcasm_label": payloads[peak]["sarcasm_label"],
+        "sarcasm_intensity": round((intensities[peak] + weighted_intensity) / 2),
+        "emotions": emotions,
+        "risk_score": max(p["risk_score"] for p in payloads),
+        "highlights": highlights[:max_highlights],
+        "explanation": explanation,
+        "mode_explanation": (
+            "Long-text mode: the input was split into overlapping sentence-aligned windows "
+            "that were scored in parallel and pooled."
+        ),
+        "windows": [
+            {
+                "index": w.index,
+                "start": w.start,
+                "end": w.end,
+                "sarcasm_label": p["sarcasm_label"],
+                "sarcasm_intensity": p["sarcasm_intensity"],
+                "risk_score": p["risk_score"],
+            }
+            for w, p in zip(windows, payloads)
+        ],
+    }
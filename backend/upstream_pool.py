@@ -0,0 +1,216 @@
+﻿"""Pool of Gemini upstreams (API key x model) with quota-aware load balancing.
+
+Each upstream is one API key bound to one model endpoint. Upstreams are
+grouped into tiers by model, cheapest/fastest first. Within a tier requests go
+to the upstream with the fewest outstanding requests relative to its weight
+(weighted least-outstanding-requests), skipping upstreams that are over their
+per-minute quota or drained after a 429.
+
+Configuration (environment):
+
+* ``GEMINI_API_KEYS``: comma-separated keys, optionally weighted as ``key:3``.
+  Falls back to the single ``GEMINI_API_KEY``.
+* ``GEMINI_MODELS``: comma-separated model names, one tier each, cheapest first.
+* ``GEMINI_API_URL``: explicit endpoint URL; overrides keys/models with a
+  single upstream (legacy configuration).
+* ``GEMINI_KEY_RPM``: per-upstream requests-per-minute quota (0 = unlimited).
+* ``GEMINI_DRAIN_SECONDS``: how long to drain an upstream after a 429 when
+  the response has no ``Retry-After`` header.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta/models")
+GEMINI_KEY_RPM = int(os.getenv("GEMINI_KEY_RPM", "0"))
+GEMINI_DRAIN_SECONDS = float(os.getenv("GEMINI_DRAIN_SECONDS", "60"))
+
+
+class UpstreamUnavailable(Exception):
+    """Raised when every upstream in a tier is drained or over quota."""
+
+
+class Upstream:
+    """One API key bound to one model endpoint, plus its live counters."""
+
+    def __init__(self, key: str, model: str, url: str, tier: int, weight: float = 1.0, rpm_limit: int = 0):
+        self.key = key
+        self.model = model
+        self.url = url
+        self.tier = tier
+        self.weight = max(weight, 0.01)
+        self.rpm_limit = rpm_limit
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.drained_until = 0.0
+        self._recent: deque = deque()  # start times within the last minute
+        self._busy_since: Optional[float] = None
+        self._busy_total = 0.0
+
+    @property
+    def label(self) -> str:
+        masked = f"...{self.key[-4:]}" if self.key else "(url)"
+        return f"{self.model}/{masked}"
+
+    def _trim(self, now: float) -> None:
+        while self._recent and now - self._recent[0] >= 60.0:
+            self._recent.popleft()
+
+    def available(self, now: float) -> bool:
+        if now < self.drained_until:
+            return False
+        self._trim(now)
+        return not self.rpm_limit or len(self._recent) < self.rpm_limit
+
+    def busy_seconds(self, now: float) -> float:
+        busy = self._busy_total
+        if self._busy_since is not None:
+            busy += now - self._busy_since
+        return busy
+
+
+class UpstreamPool:
+    """Thread-safe weighted least-outstanding-requests balancer over upstreams."""
+
+    def __init__(self, upstreams: List[Upstream]):
+        self.upstreams = upstreams
+        self.tiers = sorted({u.tier for u in upstreams})
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.upstreams)
+
+    def tier_model(self, tier: int) -> str:
+        """Model name served by `tier`."""
+        return next(u.model for u in self.upstreams if u.tier == tier)
+
+    def acquire(self, tier: int) -> Upstream:
+        with self._lock:
+            now = time.monotonic()
+            candidates = [u for u in self.upstreams if u.tier == tier and u.available(now)]
+            if not candidates:
+                raise UpstreamUnavailable(f"No Gemini upstream available in tier {tier}")
+            best = min(candidates, key=lambda u: ((u.outstanding + 1) / u.weight, u.requests / u.weight))
+            best.outstanding += 1
+            best.requests += 1
+            best._recent.append(now)
+            if best._busy_since is None:
+                best._busy_since = now
+            return best
+
+    def release(self, upstream: Upstream, status: Optional[int], retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            now = time.monotonic()
+            upstream.outstanding -= 1
+            if upstream.outstanding == 0 and upstream._busy_since is not None:
+                upstream._busy_total += now - upstream._busy_since
+                upstream._busy_since = None
+            if status is None or status >= 500:
+                upstream.errors += 1
+            elif status == 429:
+                upstream.throttled += 1
+                drain = retry_after if retry_after is not None else GEMINI_DRAIN_SECONDS
+                upstream.drained_until = max(upstream.drained_until, now + drain)
+                logger.warning("Gemini upstream %s throttled; draining for %.0fs", upstream.label, drain)
+
+    def post(self, tier: int, payload: dict, timeout: float, session: requests.Session) -> requests.Response:
+        """POST `payload` to the best upstream in `tier`, moving to another key on 429.
+
+        Raises UpstreamUnavailable when every upstream in the tier is drained,
+        over quota or answered 429.
+        """
+        tier_size = sum(1 for u in self.upstreams if u.tier == tier)
+        for _ in range(tier_size):
+            upstream = self.acquire(tier)
+            headers = {"x-goog-api-key": upstream.key} if upstream.key and "key=" not in upstream.url else None
+            status = None
+            retry_after = None
+            try:
+                resp = session.post(upstream.url, json=payload, headers=headers, timeout=timeout)
+                status = resp.status_code
+                retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
+            finally:
+                self.release(upstream, status, retry_after)
+            if status != 429:
+                return resp
+            resp.close()
+        raise UpstreamUnavailable(f"Every Gemini upstream in tier {tier} is rate limited")
+
+    def snapshot(self) -> List[dict]:
+        """Per-upstream utilization and quota counters for the metrics endpoint."""
+        with self._lock:
+            now = time.monotonic()
+            elapsed = max(now - self._started, 1e-9)
+            out = []
+            for u in self.upstreams:
+                u._trim(now)
+                out.append({
+                    "upstream": u.label,
+                    "tier": u.tier,
+                    "weight": u.weight,
+                    "outstanding": u.outstanding,
+                    "requests": u.requests,
+                    "errors": u.errors,
+                    "throttled": u.throttled,
+                    "drained_for_s": round(max(0.0, u.drained_until - now), 1),
+                    "rpm_used": len(u._recent),
+                    "rpm_limit": u.rpm_limit or None,
+                    "utilization": round(u.busy_seconds(now) / elapsed, 4),
+                })
+            return out
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _parse_keys(raw: str) -> List[tuple]:
+    keys = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, weight = item.partition(":")
+        try:
+            keys.append((key.strip(), float(weight) if weight else 1.0))
+        except ValueError:
+            logger.warning("Ignoring invalid weight for Gemini key ...%s", key[-4:])
+            keys.append((key.strip(), 1.0))
+    return keys
+
+
+def build_pool_from_env() -> UpstreamPool:
+    """Build the upstream pool from environment variables (see module docstring)."""
+    single_key = os.getenv("GEMINI_API_KEY", "")
+    explicit_url = os.getenv("GEMINI_API_URL")
+    if explicit_url:
+        if not single_key:
+            return UpstreamPool([])
+        return UpstreamPool([Upstream(single_key, "custom", explicit_url, tier=0, rpm_limit=GEMINI_KEY_RPM)])
+
+    keys = _parse_keys(os.getenv("GEMINI_API_KEYS", "")) or ([(single_key, 1.0)] if single_key else [])
+    models = [m.strip() for m in os.getenv("GEMINI_MODELS", "gemini-flash-latest").split(",") if m.strip()]
+    upstreams = [
+        Upstream(key, model, f"{GEMINI_API_BASE}/{model}:generateContent", tier=tier, weight=weight, rpm_limit=GEMINI_KEY_RPM)
+        for tier, model in enumerate(models)
+        for key, weight in keys
+    ]
+    return UpstreamPool(upstreams)
@@ -0,0 +1,244 @@
+﻿"""Video demuxing helpers built on the ffmpeg/ffprobe command-line tools.
+
+Keyframes and audio are streamed out of ffmpeg and handed to a shared worker
+pool as they are produced, so a video is never decoded whole into memory:
+
+* keyframes are chosen from the scene changes of the whole video (plus the
+  first frame); when there are more than ``VIDEO_MAX_FRAMES`` they are
+  thinned out evenly over the duration, then each is extracted as a PNG
+  image for OCR;
+* the audio track is re-encoded to compact mono MP3 segments of
+  ``VIDEO_AUDIO_SEGMENT_SECONDS`` which are transcribed independently.
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "12"))
+VIDEO_SCENE_THRESHOLD = float(os.getenv("VIDEO_SCENE_THRESHOLD", "0.3"))
+VIDEO_FRAME_MAX_WIDTH = int(os.getenv("VIDEO_FRAME_MAX_WIDTH", "1280"))
+VIDEO_AUDIO_SEGMENT_SECONDS = int(os.getenv("VIDEO_AUDIO_SEGMENT_SECONDS", "60"))
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "6"))
+
+# Scene detection runs on downscaled frames; the score barely changes and decoding is the cost
+_SCENE_DETECT_WIDTH = 320
+_PTS_RE = re.compile(r"pts_time:\s*([0-9.]+)")
+_READ_SIZE = 256 * 1024
+
+_WORKERS: Optional[ThreadPoolExecutor] = None
+_WORKERS_LOCK = threading.Lock()
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BIN) is not None and shutil.which(FFPROBE_BIN) is not None
+
+
+def _get_workers() -> ThreadPoolExecutor:
+    global _WORKERS
+    if _WORKERS is None:
+        with _WORKERS_LOCK:
+            if _WORKERS is None:
+                _WORKERS = ThreadPoolExecutor(max_workers=VIDEO_WORKERS, thread_name_prefix="video-worker")
+    return _WORKERS
+
+
+def probe_video(path: str) -> dict:
+    """Return duration (seconds) and which stream types the file contains."""
+    out = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-show_entries", "format=duration:stream=codec_type", "-of", "json", path],
+        capture_output=True, text=True, timeout=30,
+    )
+    if out.returncode != 0:
+        raise ValueError(f"Unreadable video file: {out.stderr.strip()[:200]}")
+    info = json.loads(out.stdout or "{}")
+    kinds = {s.get("codec_type") for s in info.get("streams", [])}
+    try:
+        duration = float(info.get("format", {}).get("duration", 0.0))
+    except (TypeError, ValueError):
+        duration = 0.0
+    return {"duration": duration, "has_video": "video" in kinds, "has_audio": "audio" in kinds}
+
+
+def scene_change_times(path: str, scene_threshold: float = VIDEO_SCENE_THRESHOLD) -> List[float]:
+    """Return timestamps of every scene change in the video (one decode pass, no frames kept)."""
+    vf = f"scale={_SCENE_DETECT_WIDTH}:-2,select='gt(scene\\,{scene_threshold})',showinfo"
+    proc = subprocess.Popen(
+        [FFMPEG_BIN, "-nostdin", "-hide_banner", "-i", path, "-an", "-vf", vf, "-f", "null", "-"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    times = []
+    try:
+        # showinfo logs one line per selected frame on stderr
+        for raw in proc.stderr:
+            m = _PTS_RE.search(raw.decode("utf-8", "replace"))
+            if m:
+                times.append(float(m.group(1)))
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+    return times
+
+
+def spread_timestamps(times: Sequence[float], duration: float, max_count: int) -> List[float]:
+    """Pick at most `max_count` of `times`, spread evenly over [0, duration].
+
+    Each evenly spaced target takes the nearest unused timestamp, so the last
+    part of a video with many cuts is covered as well as the first.
+    """
+    times = sorted(set(times))
+    if len(times) <= max_count:
+        return times
+    span = duration if duration > 0 else times[-1]
+    remaining = list(times)
+    chosen = []
+    for k in range(max_count):
+        target = span * k / (max_count - 1) if max_count > 1 else 0.0
+        best = min(remaining, key=lambda t: abs(t - target))
+        remaining.remove(best)
+        chosen.append(best)
+    return sorted(chosen)
+
+
+def keyframe_times(path: str, duration: float, max_frames: int = VIDEO_MAX_FRAMES,
+                   scene_threshold: float = VIDEO_SCENE_THRESHOLD) -> List[float]:
+    """Timestamps of the first frame and the scene changes, at most `max_frames` spread over the video."""
+    if max_frames <= 0:
+        return []
+    return spread_timestamps([0.0] + scene_change_times(path, scene_threshold), duration, max_frames)
+
+
+def extract_frame(path: str, t: float) -> bytes:
+    """Return the frame at `t` seconds as PNG bytes (empty if ffmpeg produced nothing)."""
+    out = subprocess.run(
+        [FFMPEG_BIN, "-nostdin", "-hide_banner", "-loglevel", "error", "-ss", f"{t:.3f}", "-i", path,
+         "-an", "-frames:v", "1", "-vf", f"scale='min({VIDEO_FRAME_MAX_WIDTH}\\,iw)':-2",
+         "-f", "image2pipe", "-vcodec", "png", "pipe:1"],
+        capture_output=True, timeout=60,
+    )
+    if out.returncode != 0:
+        logger.warning("ffmpeg frame extraction at %.2fs failed: %s", t, out.stderr.decode("utf-8", "replace")[:200])
+    return out.stdout
+
+
+def iter_audio_segments(path: str, workdir: str,
+                        segment_seconds: int = VIDEO_AUDIO_SEGMENT_SECONDS) -> Iterator[Tuple[float, str]]:
+    """Yield (start_time, mp3_path) for each audio segment as soon as ffmpeg finishes writing it."""
+    pattern = os.path.join(workdir, "audio_%04d.mp3")
+    proc = subprocess.Popen(
+        [FFMPEG_BIN, "-nostdin", "-hide_banner", "-loglevel", "error", "-i", path, "-vn",
+         "-ac", "1", "-ar", "16000", "-c:a", "libmp3lame", "-b:a", "48k",
+         "-f", "segment", "-segment_time", str(segment_seconds), pattern],
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    index = 0
+    try:
+        while True:
+            done = proc.poll() is not None
+            current = pattern % index
+            # A segment is complete once the next one exists or ffmpeg exited
+            if os.path.exists(current) and (done or os.path.exists(pattern % (index + 1))):
+                yield float(index * segment_seconds), current
+                index += 1
+                continue
+            if done:
+                break
+            time.sleep(0.05)
+        if proc.returncode:
+            logger.warning("ffmpeg audio demux failed: %s", proc.stderr.read().decode("utf-8", "replace")[:300])
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+
+def _merge_repeats(items: List[dict], key: str) -> List[dict]:
+    """Drop consecutive entries whose text repeats (static captions across scenes)."""
+    merged: List[dict] = []
+    for item in items:
+        if merged and merged[-1][key].strip().lower() == item[key].strip().lower():
+            continue
+        merged.append(item)
+    return merged
+
+
+def extract_video_signals(
+    path: str,
+    workdir: str,
+    transcribe: Callable[[bytes, str], str],
+    ocr: Optional[Callable[[bytes], str]] = None,
+) -> dict:
+    """Transcribe audio segments and OCR keyframes concurrently.
+
+    Two producer threads pick keyframes and demux audio; every frame/segment
+    is submitted to the shared worker pool as soon as it is available.
+    Returns duration, timestamped transcript segments and frame OCR text.
+    """
+    info = probe_video(path)
+    workers = _get_workers()
+    frame_jobs: list = []
+    audio_jobs: list = []
+    errors: list = []
+
+    def ocr_frame(t: float) -> str:
+        try:
+            png = extract_frame(path, t)
+            return ocr(png) if png else ""
+        except Exception as e:
+            logger.warning("Keyframe OCR at %.2fs failed: %s", t, e)
+            return ""
+
+    def transcribe_segment(seg_path: str) -> str:
+        with open(seg_path, "rb") as f:
+            data = f.read()
+        try:
+            return transcribe(data, "audio/mp3")
+        finally:
+            os.unlink(seg_path)
+
+    def produce_frames():
+        try:
+            # Frames are extracted by seeking, in parallel on the worker pool
+            for t in keyframe_times(path, info["duration"]):
+                frame_jobs.append((t, workers.submit(ocr_frame, t)))
+        except Exception as e:
+            errors.append(e)
+
+    def produce_audio():
+        try:
+            for t, seg_path in iter_audio_segments(path, workdir):
+                audio_jobs.append((t, workers.submit(transcribe_segment, seg_path)))
+        except Exception as e:
+            errors.append(e)
+
+    producers = []
+    if info["has_video"] and ocr is not None:
+        producers.append(threading.Thread(target=produce_frames, name="video-frames"))
+    if info["has_audio"]:
+        producers.append(threading.Thread(target=produce_audio, name="video-audio"))
+    for p in producers:
+        p.start()
+    for p in producers:
+        p.join()
+    if errors:
+        logger.warning("Video demux error: %s", errors[0])
+
+    # Transcription errors propagate (they surface as HTTP errors upstream)
+    segments = [{"t": round(t, 2), "text": fut.result().strip()} for t, fut in audio_jobs]
+    frames = [{"t": round(t, 2), "ocr_text": fut.result().strip()} for t, fut in frame_jobs]
+    return {
+        "duration": info["duration"],
+        "transcript_segments": [s for s in segments if s["text"]],
+        "frames": _merge_repeats([f for f in frames if f["ocr_text"]], "ocr_text"),
+    }